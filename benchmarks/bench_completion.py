@@ -0,0 +1,81 @@
+"""Measure what on_command_completion costs a successful command
+
+Compares calling process_typo on every completion (the old behaviour)
+with the pre-filtered listener, for a plain command and for a group
+that was passed a non-subcommand argument.
+
+Run with ``python benchmarks/bench_completion.py [runs]``
+"""
+import asyncio
+import sys
+from time import perf_counter
+from types import SimpleNamespace
+
+from discord.ext import commands
+
+from neobot.core.leven import LRUCache, TypoSuggest, similarity_func_factory
+
+async def _callback(ctx):
+    pass
+
+def make_bot():
+    bot = commands.Bot(",")
+    for i in range(100):
+        bot.add_command(commands.Command(_callback, name=f"command{i}"))
+
+    group = commands.Group(_callback, name="group", invoke_without_command=True)
+    for i in range(10):
+        group.add_command(commands.Command(_callback, name=f"sub{i}"))
+    bot.add_command(group)
+    return bot
+
+def make_ctx(bot, name, subcommand_passed=None):
+    cmd = bot.get_command(name)
+    return SimpleNamespace(
+        prefix=",",
+        command=cmd,
+        invoked_with=name,
+        invoked_parents=[],
+        invoked_subcommand=None,
+        subcommand_passed=subcommand_passed,
+        author=SimpleNamespace(id=1),
+        channel=SimpleNamespace(id=2)
+    )
+
+async def timeit(func, ctx, runs):
+    start = perf_counter()
+    # warm the typo cache and let its write land
+    await func(ctx)
+    await asyncio.sleep(0)
+
+    for _ in range(runs):
+        await func(ctx)
+    return (perf_counter() - start) / runs * 1e6
+
+async def main(runs: int = 100000) -> None:
+    bot = make_bot()
+    cog = TypoSuggest(bot, similarity_func_factory(5), LRUCache(2048), detect_sub_cmd_typo=True, top=3)
+    # the typo event itself isn't what's measured
+    bot.dispatch = lambda *args, **kwargs: None
+
+    async def before(ctx):
+        cog.stats.invoked(ctx.author.id, ctx.channel.id, ctx.command.qualified_name)
+        typo = await cog.typo_client.process_typo(ctx, cog.top)
+        if typo:
+            cog._dispatch_typo(ctx, typo)
+
+    cases = {
+        "plain command": make_ctx(bot, "command42"),
+        "group, no argument": make_ctx(bot, "group"),
+        "group with argument": make_ctx(bot, "group", "argument")
+    }
+
+    print(f"{runs} completions")
+    print(f"{'case':<22} {'before us':>10} {'after us':>10}")
+    for name, ctx in cases.items():
+        old = await timeit(before, ctx, runs)
+        new = await timeit(cog.on_command_completion, ctx, runs)
+        print(f"{name:<22} {old:>10.2f} {new:>10.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:2])))
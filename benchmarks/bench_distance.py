@@ -0,0 +1,75 @@
+"""Compare the typo distance modes of similarity_func_factory
+
+Every mode is timed against scoring all names with polyleven,
+the linear scan top-k lookups used to do. Run with ``python benchmarks/bench_distance.py [names] [typos]``
+"""
+import random
+import sys
+from heapq import nsmallest
+from time import perf_counter
+
+from polyleven import levenshtein
+
+from neobot.core.leven import DISTANCES, QWERTY_NEIGHBOURS, TypoClient, similarity_func_factory
+
+THRESHOLD = 5
+TOP = 3
+REPEAT = 7
+
+def make_names(count: int, rng: random.Random):
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 12))))
+    return sorted(names)
+
+def make_typo(name: str, rng: random.Random) -> str:
+    i = rng.randrange(len(name))
+    kind = rng.choice(("swap", "adjacent", "drop"))
+    if kind == "swap" and i + 1 < len(name):
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    if kind == "adjacent" and QWERTY_NEIGHBOURS.get(name[i]):
+        return name[:i] + rng.choice(sorted(QWERTY_NEIGHBOURS[name[i]])) + name[i + 1:]
+    return name[:i] + name[i + 1:]
+
+class Group:
+    def __init__(self, names):
+        self.all_commands = dict.fromkeys(names)
+
+def main(count: int = 300, runs: int = 2000) -> None:
+    rng = random.Random(0)
+    names = make_names(count, rng)
+    cases = [(name, make_typo(name, rng)) for name in rng.choices(names, k=runs)]
+    par = Group(names)
+
+    print(f"{count} names, {runs} typos, threshold {THRESHOLD}, top {TOP}")
+    print(f"{'mode':<12} {'us/typo':>10} {'top-1 hit':>10} {'top-3 hit':>10}")
+
+    def scan(typo):
+        return nsmallest(TOP, ((levenshtein(typo, i, THRESHOLD), i) for i in names))
+
+    lookups = {"scan": scan}
+    for mode in DISTANCES:
+        client = TypoClient(None, similarity_func_factory(THRESHOLD, mode))
+        client._gen_top(par, "warmup", TOP)
+        lookups[mode] = lambda typo, client=client: client._gen_top(par, typo, TOP)
+
+    # modes take turns, so a noisy stretch doesn't land on a single one
+    elapsed = dict.fromkeys(lookups, float("inf"))
+    for _ in range(REPEAT):
+        for mode, lookup in lookups.items():
+            start = perf_counter()
+            for _, typo in cases:
+                lookup(typo)
+            elapsed[mode] = min(elapsed[mode], perf_counter() - start)
+
+    for mode, lookup in lookups.items():
+        first = top = 0
+        for name, typo in cases:
+            res = lookup(typo)
+            first += bool(res) and res[0][1] == name
+            top += any(i[1] == name for i in res)
+
+        print(f"{mode:<12} {elapsed[mode] / runs * 1e6:>10.1f} {first / runs:>10.1%} {top / runs:>10.1%}")
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,67 @@
+"""Measure prefix lookup latency with and without the primary key on gid
+
+Fills two scratch tables with the same rows, one shaped like the old
+prefix table and one like the migrated one, then times lookups of
+existing and missing guilds against both. The tables are dropped after.
+
+Needs a postgres server, run with
+``python benchmarks/bench_pg_lookup.py <database url> [rows] [lookups]``
+or set DATABASE_URL.
+"""
+import asyncio
+import os
+import random
+import sys
+from time import perf_counter
+
+import asyncpg
+
+from neobot.core.leven.stats import Histogram
+
+TABLES = {
+    "before": "CREATE TABLE {} (gid BIGINT NOT NULL CHECK (gid >= 0), prefix TEXT ARRAY)",
+    "after": "CREATE TABLE {} (gid BIGINT PRIMARY KEY CHECK (gid >= 0), prefix TEXT ARRAY)"
+}
+
+async def lookup(con, table: str, gids) -> Histogram:
+    stmt = await con.prepare(f"SELECT prefix FROM {table} WHERE gid = $1")
+    hist = Histogram()
+    for gid in gids:
+        start = perf_counter()
+        await stmt.fetchval(gid)
+        hist.record((perf_counter() - start) * 1e6)
+    return hist
+
+async def main(dsn: str, rows: int = 100000, lookups: int = 2000) -> None:
+    con = await asyncpg.connect(dsn)
+    rng = random.Random(0)
+    # snowflake sized ids, half the looked up ones have no row
+    gids = [rng.randrange(1 << 60) for _ in range(rows)]
+    hits = rng.sample(gids, lookups // 2)
+    misses = [rng.randrange(1 << 60) for _ in range(lookups // 2)]
+
+    try:
+        for name, ddl in TABLES.items():
+            table = f"prefix_bench_{name}"
+            await con.execute(f"DROP TABLE IF EXISTS {table}")
+            await con.execute(ddl.format(table))
+            await con.copy_records_to_table(table, records=((gid, ["!", "?"]) for gid in gids))
+            await con.execute(f"ANALYZE {table}")
+
+        print(f"{rows} rows, {lookups} lookups")
+        print(f"{'':<8} {'hit p50':>10} {'hit p99':>10} {'miss p50':>10} {'miss p99':>10}  (us)")
+        for name in TABLES:
+            table = f"prefix_bench_{name}"
+            hit = await lookup(con, table, hits)
+            miss = await lookup(con, table, misses)
+            print(f"{name:<8} {hit.percentile(50):>10g} {hit.percentile(99):>10g} {miss.percentile(50):>10g} {miss.percentile(99):>10g}")
+    finally:
+        for name in TABLES:
+            await con.execute(f"DROP TABLE IF EXISTS prefix_bench_{name}")
+        await con.close()
+
+if __name__ == "__main__":
+    dsn = sys.argv[1] if len(sys.argv) > 1 else os.getenv("DATABASE_URL")
+    if not dsn:
+        sys.exit("Pass a database url or set DATABASE_URL")
+    asyncio.run(main(dsn, *map(int, sys.argv[2:4])))
@@ -0,0 +1,84 @@
+"""Measure the per message cost of matching guild prefixes in NeoBase.get_context
+
+Both arms go through NeoBase.get_context and get_prefix, so discord.py's
+own matching and its copy of the prefixes into a list are part of the cost:
+
+- ``before`` is the old behaviour, PrefixManager built ``prefixes + mentions``
+  for every message
+- ``after`` is PrefixManager now, which returns the guild's cached ``ordered`` tuple
+
+Handing discord.py only the prefixes a message could start with, behind a
+ContextVar set by get_context, made no measurable difference and was dropped.
+
+Run with ``python benchmarks/bench_prefix.py [guilds] [prefixes per guild] [messages]``
+"""
+import asyncio
+import random
+import sys
+from time import perf_counter
+from types import SimpleNamespace
+
+from neobot.core.bot import NeoBase
+from neobot.core.utils.db_abc import DbClientABC
+from neobot.core.utils.prefix_manager import PrefixManager
+
+class NullDb(DbClientABC):
+    async def load(self):
+        return {}
+
+    async def get_prefix(self, guild):
+        return None
+
+    async def set_prefix(self, guild, prefixes):
+        pass
+
+    async def append_prefix(self, guild, prefix):
+        pass
+
+    async def create_prefix_table(self):
+        pass
+
+async def main(guilds: int = 10000, per_guild: int = 10, messages: int = 200000) -> None:
+    rng = random.Random(0)
+    user = SimpleNamespace(id=1234)
+    manager = await PrefixManager(",", SimpleNamespace(user=user, guilds=[]), NullDb())
+
+    objs = [SimpleNamespace(id=i) for i in range(guilds)]
+    for guild in objs:
+        manager.set_local_prefix(guild, ["".join(rng.choice("!?$%&.;>") for _ in range(rng.randint(1, 4))) for _ in range(per_guild)])
+
+    author = SimpleNamespace(id=1, bot=False)
+    cases = []
+    for guild in rng.choices(objs, k=messages):
+        prefix = rng.choice(manager[guild])
+        cases.append(SimpleNamespace(guild=guild, author=author, content=prefix + "help", _state=None))
+
+    mentions = manager._mentions
+
+    async def old_prefix(bot, msg):
+        # PrefixManager.get_prefix before prefixes were compiled
+        return manager._prefixes[msg.guild.id] and [*manager._prefixes[msg.guild.id], *mentions]
+
+    print(f"{guilds} guilds, {per_guild} prefixes each, {messages} messages")
+    print(f"{'':<8} {'ns/msg':>10}")
+    for name, prefix in (("before", old_prefix), ("after", manager)):
+        bot = NeoBase(",")
+        bot.command_prefix = prefix
+        bot._connection.user = user
+        get_context = bot.get_context
+
+        # compile every guild first, like a warmed up bot
+        for msg in cases:
+            await get_context(msg)
+
+        elapsed = float("inf")
+        for _ in range(3):
+            start = perf_counter()
+            for msg in cases:
+                await get_context(msg)
+            elapsed = min(elapsed, perf_counter() - start)
+
+        print(f"{name:<8} {elapsed / messages * 1e9:>10.0f}")
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:4])))
@@ -0,0 +1,87 @@
+"""Measure the memory PrefixManager spends on stored prefixes at large guild counts
+
+Guilds get prefixes the way they come out of the Db, a fresh list of
+fresh strings per guild, drawn mostly from a few popular sets with a
+tail of unique ones. The old layout, a list per guild plus a
+CompiledPrefixes per guild, is compared with the interned tuples and
+shared CompiledPrefixes PrefixManager keeps now.
+
+Run with ``python benchmarks/bench_prefix_memory.py [guilds] [unique percent]``
+"""
+import asyncio
+import json
+import random
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+from neobot.core.utils.db_abc import DbClientABC
+from neobot.core.utils.prefix_manager import CompiledPrefixes, PrefixManager
+
+POPULAR = [["!"], ["?"], ["$"], ["."], [">"], ["!", "?"], ["n!"], ["neo "], ["-"], [";"], ["!!"], ["%"]]
+
+class NullDb(DbClientABC):
+    async def load(self):
+        return {}
+
+    async def get_prefix(self, guild):
+        return None
+
+    async def set_prefix(self, guild, prefixes):
+        pass
+
+    async def append_prefix(self, guild, prefix):
+        pass
+
+    async def create_prefix_table(self):
+        pass
+
+def rows(guilds: int, unique: float):
+    rng = random.Random(0)
+    for gid in range(guilds):
+        if rng.random() < unique:
+            prefixes = ["".join(rng.choice("!?$%&.;>abc") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 3))]
+        else:
+            prefixes = rng.choice(POPULAR)
+        # a round trip through json makes new objects, like a Db driver does
+        yield gid, json.loads(json.dumps(prefixes))
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, size
+
+async def main(guilds: int = 100000, unique_pct: float = 5.0) -> None:
+    unique = unique_pct / 100
+    mentions = ["<@!1234> ", "<@1234> "]
+
+    def old():
+        prefixes = dict(rows(guilds, unique))
+        compiled = {gid: CompiledPrefixes([*prefix, *mentions]) for gid, prefix in prefixes.items()}
+        return prefixes, compiled
+
+    bot = SimpleNamespace(user=SimpleNamespace(id=1234), guilds=[])
+    manager = await PrefixManager(",", bot, NullDb())
+
+    def new():
+        for gid, prefix in rows(guilds, unique):
+            manager._store(gid, prefix)
+            manager._compile(gid)
+        return manager
+
+    _, old_size = measure(old)
+    _, new_size = measure(new)
+
+    report = manager.memory_footprint()
+    print(f"{guilds} guilds, {unique_pct:g}% with unique prefixes")
+    print(f"{'layout':<10} {'traced MiB':>12} {'bytes/guild':>12}")
+    print(f"{'lists':<10} {old_size / 2**20:>12.2f} {old_size / guilds:>12.1f}")
+    print(f"{'interned':<10} {new_size / 2**20:>12.2f} {new_size / guilds:>12.1f}")
+    print(f"memory_footprint(): {report}")
+
+if __name__ == "__main__":
+    args = sys.argv[1:3]
+    asyncio.run(main(int(args[0]) if args else 100000, float(args[1]) if len(args) > 1 else 5.0))
@@ -7,6 +7,7 @@ from enum import Enum
 from typing import List, Optional
 
 from neobot import NeoBot
+from neobot.core.utils import DbClientABC
 from neobot.web import main as web_main
 from neobot.devtools import app as tools
 
@@ -21,7 +22,18 @@ app = Typer()
 app.add_typer(tools, name = "tools")
 
 @app.command(name = "run", help = "Run neobot")
-def main(token: str = Argument("")) -> int:
+def main(token: str = Argument(""),
+         json_log: Optional[Path] = Option(
+             None, "--json-log",
+             file_okay = True,
+             dir_okay = False,
+             writable = True,
+             resolve_path = True,
+             help = "Also write logs to this file as JSON lines"
+         ),
+         json_log_max_mb: int = Option(64, "--json-log-max-mb", help = "Rotate the JSON log once it reaches this many MiB, 0 to never rotate"),
+         json_log_backups: int = Option(5, "--json-log-backups", help = "Rotated JSON logs to keep")
+    ) -> int:
     from dotenv import load_dotenv
     load_dotenv()
     from os import getenv
@@ -34,10 +46,23 @@ def main(token: str = Argument("")) -> int:
             raise Abort()
 
     DB_DNS = getenv("DATABASE_URL")
-    db_client = None
-    if DB_DNS:
+    db_client: Optional[DbClientABC] = None
+    if DB_DNS and DB_DNS.startswith("sqlite:///"):
+        from neobot.core.utils import SqliteClient
+        db_client = SqliteClient(DB_DNS[len("sqlite:///"):])
+    elif DB_DNS:
         from neobot.core.utils import PgClient
-        db_client = PgClient(DB_DNS)
+        db_client = PgClient(
+            DB_DNS,
+            min_size=int(getenv("DATABASE_POOL_MIN", 2)),
+            max_size=int(getenv("DATABASE_POOL_MAX", 10))
+        )
+
+    CACHE_URL = getenv("CACHE_URL")
+    cache = None
+    if CACHE_URL:
+        from neobot.core.leven import LRUCache, RemoteCache
+        cache = RemoteCache(CACHE_URL, near=LRUCache(2048))
 
     if sys.version_info[0] ==  3 and sys.version_info[1] >=  8 and sys.platform.startswith('win'):
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -46,7 +71,16 @@ def main(token: str = Argument("")) -> int:
     logging.basicConfig(format = "%(asctime)s %(name)s:%(levelname)s: %(message)s", level = logging.INFO, datefmt = "[%a, %d %B %Y %X]")
     logging.getLogger("discord.gateway").setLevel(logging.WARNING)
 
-    bot = NeoBot(",", db_client=db_client)
+    if json_log is not None:
+        from neobot.core.logs import JsonLinesHandler
+        json_handler = JsonLinesHandler(json_log, max_bytes = json_log_max_mb * 1024 * 1024, backup_count = json_log_backups)
+        logging.getLogger().addHandler(json_handler)
+        # a line per command, kept out of stderr
+        commands = logging.getLogger("neobot.commands")
+        commands.addHandler(json_handler)
+        commands.propagate = False
+
+    bot = NeoBot(",", db_client=db_client, cache=cache)
     bot.load_extension("neobot.cogs")
     web_main(bot)
     bot.run(token)
@@ -95,7 +129,7 @@ def profile(token: str = Argument(""),
 
     yappi.start()
 
-    main(token)
+    main(token, json_log = None, json_log_max_mb = 64, json_log_backups = 5)
 
     yappi.stop()
 
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import TYPE_CHECKING, Callable, ClassVar, List, Union
+from typing import TYPE_CHECKING, Callable, ClassVar, List, Optional, Union
 
 from discord.errors import HTTPException
 from discord.ext.commands import Bot
@@ -14,18 +14,29 @@ from discord.ext.commands.errors import (BotMissingPermissions, CheckFailure,
                                          NotOwner, NSFWChannelRequired)
 
 from neobot.core.leven.cog import TypoSuggest, similarity_func_factory
-from neobot.core.leven import LRUCache
-from neobot.core.utils import EmbedContext, PrefixManager, get_emoji
+from neobot.core.leven import LRUCache, RemoteCache
+from neobot.core.leven._utils import maybe_awaitable
+from neobot.core.logs import command_context
+from neobot.core.utils import EmbedContext, GuildSettings, PrefixManager, get_emoji
 
 if TYPE_CHECKING:
+    from neobot.core.leven.cache import CacheABC
     from neobot.core.leven.logic import TypoSuggestion
     from neobot.core.utils.credits import Credits
     from neobot.core.utils.db_abc import DbClientABC
 
 logger = logging.getLogger(__name__)
+# One record per invocation, only written to handlers added to this logger
+# itself so stderr isn't flooded, see `neobot run --json-log`
+command_logger = logging.getLogger("neobot.commands")
 
 class NeoBase(Bot):
-    def __init__(self, command_prefix: Union[List[str], str], help_command = _Dh(), description = None, *, db_client: DbClientABC = None, **options) -> None:
+    # Seconds prefix writes are buffered for, see PrefixManager
+    PREFIX_WRITE_BEHIND: ClassVar[Optional[float]] = None
+    # Seconds guild settings writes are buffered for, see GuildSettings
+    SETTINGS_WRITE_BEHIND: ClassVar[Optional[float]] = None
+
+    def __init__(self, command_prefix: Union[List[str], str], help_command = _Dh(), description = None, *, db_client: Optional[DbClientABC] = None, cache: Optional[CacheABC] = None, **options) -> None:
         self._credits: Credits = [
             {
                 "Entity": "[WizzyGeek](https://github.com/WizzyGeek)", # 😎 Yes.
@@ -40,14 +51,27 @@ class NeoBase(Bot):
         options.setdefault("strip_after_prefix", True)
         options.setdefault("case_insensitive", True)
 
+        # A cache shared across processes, e.g a RemoteCache
+        self.shared_cache = cache
+        prefix_cache = self.namespaced_cache("prefix")
+        self.db_client = db_client
+        # Per guild settings, these need a Db too
+        self.settings: Optional[GuildSettings] = None
+
         if db_client:
+            self.settings = GuildSettings(self, db_client, write_behind=self.SETTINGS_WRITE_BEHIND)
+
             async def postponed(*args, **kwargs):
-                self.command_prefix = await PrefixManager(command_prefix, self, db_client) # postponed eval
-                self.remove_listener(postponed, "on_ready")
+                # on_connect comes before the guilds stream in, so they
+                # can be warmed as they arrive instead of on their first message
+                self.command_prefix = await PrefixManager(command_prefix, self, db_client, warm_cache=True, cache=prefix_cache, write_behind=self.PREFIX_WRITE_BEHIND) # postponed eval
+                self.remove_listener(postponed, "on_connect")
 
         super().__init__(command_prefix, help_command, description, **options)
         if db_client:
-            self.add_listener(postponed, "on_ready") # type: ignore[pyright]
+            self.add_listener(postponed, "on_connect") # type: ignore[pyright]
+            self.add_check(self.settings.check) # type: ignore[union-attr]
+            self.before_invoke(self.settings.apply_cooldown) # type: ignore[union-attr]
         if hasattr(self, "setup"):
             self.setup()
 
@@ -57,6 +81,46 @@ class NeoBase(Bot):
         else:
             self._credits.append({"Entity": entity, "Reason": reason})
 
+    def add_command(self, command):
+        super().add_command(command)
+        # keep the typo client in sync, this also covers cog (un)loading
+        typo_client = getattr(self, "typo_client", None)
+        if typo_client is not None:
+            typo_client.sync_command(self, command)
+
+    def remove_command(self, name: str):
+        command = super().remove_command(name)
+        typo_client = getattr(self, "typo_client", None)
+        if command is not None and typo_client is not None:
+            typo_client.sync_command(self, command)
+        return command
+
+    async def start(self, *args, **kwargs) -> None:
+        if self.db_client is not None:
+            await self.db_client.init()
+        await super().start(*args, **kwargs)
+
+    async def close(self) -> None:
+        await super().close()
+        if isinstance(self.command_prefix, PrefixManager):
+            # buffered prefix writes must not be lost on shutdown
+            await self.command_prefix.close()
+        if self.settings is not None:
+            await self.settings.close()
+        if self.db_client is not None:
+            await self.db_client.close()
+        if self.shared_cache is not None and hasattr(self.shared_cache, "close"):
+            await maybe_awaitable(self.shared_cache.close())
+
+    def namespaced_cache(self, namespace: str) -> Optional[CacheABC]:
+        """Return the part of :attr:`shared_cache` used for ``namespace``
+
+        Caches with different keys and values must not share a RemoteCache namespace.
+        """
+        if isinstance(self.shared_cache, RemoteCache):
+            return self.shared_cache.namespaced(namespace)
+        return self.shared_cache
+
     @property
     def prefix(self):
         return self.command_prefix
@@ -68,11 +132,33 @@ class NeoBase(Bot):
     async def get_context(self, msg, *, cls=EmbedContext):
         return await super().get_context(msg, cls=cls)
 
+    async def invoke(self, ctx):
+        # Records logged during the command carry its guild, command and latency
+        token = command_context.set(ctx)
+        try:
+            await super().invoke(ctx)
+        finally:
+            if command_logger.handlers and ctx.command is not None:
+                command_logger.info("Invoked %s", ctx.command.qualified_name, extra={"failed": ctx.command_failed})
+            command_context.reset(token)
+
+    async def typo_enabled(self, ctx) -> bool:
+        """Whether command typos should be answered in ``ctx``"""
+        if self.settings is None:
+            return True
+        return (await self.settings.get(ctx.guild)).typo_suggest
+
 class NeoBot(NeoBase):
     TYPO_DISTANCE: ClassVar[int] = 5
+    TYPO_SUGGESTIONS: ClassVar[int] = 3
+    PREFIX_WRITE_BEHIND: ClassVar[Optional[float]] = 5.0
+    SETTINGS_WRITE_BEHIND: ClassVar[Optional[float]] = 5.0
 
     def setup(self) -> None:
-        self.add_cog(TypoSuggest(self, distance_func=similarity_func_factory(self.TYPO_DISTANCE), cache=LRUCache(2048), detect_sub_cmd_typo=True))
+        cache = self.namespaced_cache("typo")
+        if cache is None:
+            cache = LRUCache(2048)
+        self.add_cog(TypoSuggest(self, distance_func=similarity_func_factory(self.TYPO_DISTANCE), cache=cache, detect_sub_cmd_typo=True, top=self.TYPO_SUGGESTIONS, enabled=self.typo_enabled))
 
     async def on_command_error(self, ctx: EmbedContext, error: CommandError):
         # return if already handled by the command's
@@ -86,7 +172,11 @@ class NeoBot(NeoBase):
         if isinstance(error, DisabledCommand):
             async with ctx.std_embed() as em:
                 em.title = get_emoji("CAUTION") + " | Command Disabled"
-                em.description = f"The `{ctx.command}` command has currently beem disabled for maintenance purposes"
+                if ctx.command is not None and ctx.command.enabled:
+                    # disabled by the server, see GuildSettings
+                    em.description = f"The `{ctx.command}` command has been disabled in this server"
+                else:
+                    em.description = f"The `{ctx.command}` command has currently beem disabled for maintenance purposes"
                 error.handled = True
             return
         if isinstance(error, CheckFailure):
@@ -180,7 +270,7 @@ class NeoBot(NeoBase):
         logger.error(event_method, exc_info=event_method)
 
     async def on_command_typo(self, ctx: EmbedContext, typo: TypoSuggestion):
-        if typo.get_best()[0] > self.TYPO_DISTANCE:
+        if not typo.suggestions or typo.get_best()[0] > self.TYPO_DISTANCE:
             return
 
         sub_cmd = not (typo.parent is self)
@@ -192,5 +282,5 @@ class NeoBot(NeoBase):
             em.description = ("The " + _cmd + " "
                 + "`" + par_name + (' ' * sub_cmd) + typo.typo + "`"
                 + " was not found, maybe you meant:\n"
-                + "```\n" + "\n".join(i for i in map(lambda tr: par_name + " " + tr[1], typo.get_top(3))) + "```")
+                + "```\n" + "\n".join(i for i in map(lambda tr: par_name + " " + tr[1], typo.get_top(self.TYPO_SUGGESTIONS))) + "```")
             em.set_footer(text="Did I wrongly report this as a command typo? If yes, Report it please.")
@@ -1,4 +1,9 @@
 # polyleven https://pypi.org/project/polyleven/
+from .batch import *
 from .cache import *
 from .cog import *
-from .logic import *
\ No newline at end of file
+from .distance import *
+from .index import *
+from .logic import *
+from .remote import *
+from .stats import *
\ No newline at end of file
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from itertools import repeat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from polyleven import levenshtein
+
+try:
+    import numpy as np
+except (ImportError, ModuleNotFoundError):
+    # an optional extra, see the "fast" extra in pyproject.toml
+    np = None # type: ignore[assignment]
+
+__all__ = (
+    "HAS_NUMPY",
+    "PackedNames",
+    "batch_levenshtein"
+)
+
+HAS_NUMPY = np is not None
+
+# Below this many names numpy's per call overhead outweighs
+# the per name call overhead of the polyleven fallback
+NUMPY_MIN_NAMES = 2048
+
+class PackedNames:
+    """Names packed once so they can be scored against a typo in one call
+
+    With numpy available the names are stored as one contiguous matrix of
+    character codes (a row per name, padded) along with their lengths.
+    """
+    __slots__ = ("names", "codes", "active", "order", "alphabet")
+
+    def __init__(self, names: Iterable[str]) -> None:
+        self.names: Tuple[str, ...] = tuple(names)
+        self.codes = None
+        self.active: List[int] = []
+        self.order = None
+        self.alphabet: Dict[str, int] = {}
+
+        if np is None or not self.names:
+            return
+
+        alphabet = self.alphabet
+        for name in self.names:
+            for char in name:
+                alphabet.setdefault(char, len(alphabet))
+
+        # Rows are sorted longest first so the names still being
+        # walked at any column are always a prefix of the rows
+        order = sorted(range(len(self.names)), key=lambda i: -len(self.names[i]))
+        # The padding code never matches any typo character
+        pad = len(alphabet)
+        width = len(self.names[order[0]])
+        codes = np.full((len(self.names), width), pad, dtype=np.intp)
+        for row, idx in enumerate(order):
+            name = self.names[idx]
+            codes[row, :len(name)] = [alphabet[i] for i in name]
+
+        # column major, we walk the names one column at a time
+        self.codes = np.asfortranarray(codes)
+        # rows still active at each column
+        lengths = [len(self.names[i]) for i in order]
+        self.active = [sum(1 for i in lengths if i > col) for col in range(width)]
+        self.order = np.array(order, dtype=np.intp)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __repr__(self) -> str:
+        return f"<PackedNames names={len(self.names)} numpy={self.codes is not None}>"
+
+def _myers(typo: str, packed: PackedNames) -> List[int]:
+    """Bit-parallel levenshtein (Myers/Hyyrö) of ``typo`` against every packed name at once"""
+    m = len(typo)
+    one = np.uint64(1)
+    high = np.uint64(m - 1)
+
+    peq = np.zeros(len(packed.alphabet) + 1, dtype=np.uint64)
+    for i, char in enumerate(typo):
+        idx = packed.alphabet.get(char, None)
+        if idx is not None:
+            peq[idx] |= np.uint64(1 << i)
+
+    n = len(packed.names)
+    pv = np.full(n, (1 << m) - 1, dtype=np.uint64)
+    mv = np.zeros(n, dtype=np.uint64)
+    # unsigned wraparound cancels out, the final scores are never negative
+    score = np.full(n, m, dtype=np.uint64)
+
+    codes, order = packed.codes, packed.order
+    assert codes is not None and order is not None
+
+    for col, rows in enumerate(packed.active):
+        eq = peq[codes[:rows, col]]
+        pv_ = pv[:rows]
+        mv_ = mv[:rows]
+
+        xv = eq | mv_
+        xh = (((eq & pv_) + pv_) ^ pv_) | eq
+        ph = mv_ | ~(xh | pv_)
+        mh = pv_ & xh
+
+        score[:rows] += (ph >> high) & one
+        score[:rows] -= (mh >> high) & one
+
+        ph = (ph << one) | one
+        mh = mh << one
+        pv[:rows] = mh | ~(xv | ph)
+        mv[:rows] = ph & xv
+
+    res = np.empty(n, dtype=np.uint64)
+    res[order] = score
+    return res.tolist()
+
+def batch_levenshtein(typo: str, packed: PackedNames, cutoff: Optional[int] = None) -> List[int]:
+    """Return the levenshtein distance between ``typo`` and every packed name, in order
+
+    Distances above ``cutoff`` are reported as ``cutoff + 1`` like :func:`polyleven.levenshtein`.
+    """
+    if packed.codes is not None and len(packed.names) >= NUMPY_MIN_NAMES and 0 < len(typo) <= 64:
+        res = _myers(typo, packed)
+        if cutoff is not None:
+            res = [i if i <= cutoff else cutoff + 1 for i in res]
+        return res
+
+    if cutoff is None:
+        return list(map(levenshtein, repeat(typo), packed.names))
+    return list(map(levenshtein, repeat(typo), packed.names, repeat(cutoff)))
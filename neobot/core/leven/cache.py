@@ -2,7 +2,10 @@ from __future__ import annotations
 
 from collections import OrderedDict
 from collections.abc import Hashable
-from typing import Awaitable, Dict, Generic, Tuple, TypeVar, Optional, Union, overload
+from dataclasses import dataclass
+from sys import getsizeof
+from time import monotonic
+from typing import Awaitable, Callable, Dict, Generic, Tuple, TypeVar, Optional, Union, overload
 from abc import ABC, abstractmethod
 
 K = TypeVar("K", bound=Hashable)
@@ -13,7 +16,9 @@ T = TypeVar("T")
 __all__ = (
     "Cache",
     "LRUCache",
-    "CacheABC"
+    "CacheABC",
+    "CacheStats",
+    "approx_sizeof"
 )
 
 class CacheABC(Generic[K, V], ABC):
@@ -33,7 +38,7 @@ class CacheABC(Generic[K, V], ABC):
         return NotImplemented
 
     @abstractmethod
-    def put(self, key: K, value: V) -> None:
+    def put(self, key: K, value: V) -> Union[None, Awaitable[None]]:
         """Can be overridden as an async method."""
         return None
 
@@ -73,14 +78,80 @@ class Cache(CacheABC[K, V]):
     def clear(self) -> None:
         self._cache.clear()
 
+def approx_sizeof(obj: object) -> int:
+    """Roughly estimate the memory used by ``obj`` and the containers in it"""
+    size = getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float)):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approx_sizeof(k) + approx_sizeof(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(approx_sizeof(i) for i in obj)
+    return size
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.lookups or 1)
+
 class LRUCache(Cache[K, V]):
-    def __init__(self, maxsize: Optional[int] = None) -> None:
+    """A least recently used cache
+
+    Parameters
+    ----------
+    maxsize : Optional[int]
+        The maximum number of entries, unbounded if None
+    ttl : Optional[float]
+        Seconds after which entries expire, never if None.
+        Can be overridden per entry in :meth:`put`
+    maxbytes : Optional[int]
+        An approximate memory budget for the cached values, unbounded if None
+    sizeof : Optional[Callable[[V], int]]
+        Used to estimate the size of values when ``maxbytes`` is set,
+        by default :func:`approx_sizeof`
+    """
+    def __init__(self, maxsize: Optional[int] = None, *, ttl: Optional[float] = None, maxbytes: Optional[int] = None, sizeof: Optional[Callable[[V], int]] = None) -> None:
         if isinstance(maxsize, int):
             maxsize = max(maxsize, 0)
         else:
             maxsize = None
         self.maxsize = maxsize
-        self._cache: OrderedDict[K, V] = OrderedDict()
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof: Callable[[V], int] = sizeof or approx_sizeof
+        self.nbytes = 0
+        self.stats = CacheStats()
+        # value, expiry time, size. Least recently used first.
+        self._cache: OrderedDict[K, Tuple[V, Optional[float], int]] = OrderedDict() # type: ignore[assignment]
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, key: K) -> bool:
+        entry = self._cache.get(key, None)
+        return entry is not None and not self._expired(key, entry)
+
+    def __repr__(self) -> str:
+        return f"<LRUCache size={len(self._cache)} maxsize={self.maxsize} nbytes={self.nbytes} {self.stats}>"
+
+    def _expired(self, key: K, entry: Tuple[V, Optional[float], int]) -> bool:
+        if entry[1] is None or entry[1] > monotonic():
+            return False
+
+        del self._cache[key]
+        self.nbytes -= entry[2]
+        self.stats.expirations += 1
+        return True
 
     @overload
     def peek(self, key: K) -> Optional[V]:
@@ -91,18 +162,62 @@ class LRUCache(Cache[K, V]):
         ...
 
     def peek(self, key: K, default: Optional[T] = None) -> Union[V, Optional[T]]:
-        return self._cache.get(key, default)
+        """Get a value without touching its recency or the stats"""
+        entry = self._cache.get(key, None)
+        if entry is None or self._expired(key, entry):
+            return default
+        return entry[0]
 
     def get(self, key, default = None):
-        try:
-            self._cache.move_to_end(key, last=False)
-        except KeyError:
+        entry = self._cache.get(key, None)
+        if entry is None or self._expired(key, entry):
+            self.stats.misses += 1
             return default
-        else:
-            return self._cache[key]
 
-    def put(self, key: K, value: V) -> None:
-        super().put(key, value)
-        if self.maxsize is not None:
-            if len(self._cache) > self.maxsize:
-                self._cache.popitem()
+        self._cache.move_to_end(key)
+        self.stats.hits += 1
+        return entry[0]
+
+    def put(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.ttl
+
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[2]
+
+        size = self.sizeof(value) if self.maxbytes is not None else 0
+        self._cache[key] = (value, None if ttl is None else monotonic() + ttl, size)
+        self.nbytes += size
+
+        cache = self._cache
+        while cache and ((self.maxsize is not None and len(cache) > self.maxsize)
+            or (self.maxbytes is not None and self.nbytes > self.maxbytes)):
+            self.nbytes -= cache.popitem(last=False)[1][2]
+            self.stats.evictions += 1
+
+    def pop(self, key, default = None):
+        entry = self._cache.pop(key, None)
+        if entry is None:
+            return default
+        self.nbytes -= entry[2]
+        return entry[0]
+
+    def popitem(self) -> Tuple[K, V]:
+        """Remove and return the least recently used item"""
+        key, entry = self._cache.popitem(last=False)
+        self.nbytes -= entry[2]
+        return key, entry[0]
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self.nbytes = 0
+
+    def expire(self) -> int:
+        """Drop every expired entry, returns the number of entries dropped"""
+        now = monotonic()
+        expired = [k for k, v in self._cache.items() if v[1] is not None and v[1] <= now]
+        for key in expired:
+            self.nbytes -= self._cache.pop(key)[2]
+        self.stats.expirations += len(expired)
+        return len(expired)
@@ -1,37 +1,109 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Callable
+from functools import partial
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
 
-from discord.ext.commands import Cog
+from discord import Embed
+from discord.ext.commands import Cog, Group, command, is_owner
 from discord.ext.commands.errors import CommandNotFound
 from polyleven import levenshtein
 
+from .batch import batch_levenshtein
+from .distance import batch_map, osa_distance, qwerty_distance, rerank_top
 from .logic import TypoClient
 
 if TYPE_CHECKING:
+    from discord.ext.commands import Context
+
     from ..utils.types import AnyBot
     from .cache import CacheABC
+    from .logic import TypoSuggestion
+    from .stats import TypoStats
 
 __all__ = (
+    "DISTANCES",
     "similarity_func_factory",
     "TypoSuggest"
 )
 
-def similarity_func_factory(max_threshold: int = None) -> Callable[[str, str], int]:
+# name: distance taking a cutoff
+DISTANCES = {
+    "levenshtein": levenshtein,
+    "osa": osa_distance,
+    "qwerty": qwerty_distance
+}
+
+def similarity_func_factory(max_threshold: int = None, mode: str = "levenshtein") -> Callable[[str, str], int]:
+    """Create a distance function for :class:`TypoSuggest`
+
+    Parameters
+    ----------
+    max_threshold : Optional[int]
+        Distances above this are all reported as ``max_threshold + 1``
+    mode : str
+        ``"levenshtein"``, ``"osa"`` (swapped letters cost 1) or ``"qwerty"``
+        (hitting a key next to the right one costs half), by default "levenshtein"
+    """
+    try:
+        func = DISTANCES[mode]
+    except KeyError:
+        raise ValueError(f"Unknown distance mode {mode!r}, expected one of {', '.join(DISTANCES)}") from None
+
     if max_threshold is None:
-        return levenshtein
-    else:
-        return lambda x, y: levenshtein(x, y, max_threshold)
+        return func
+
+    def distance(x: str, y: str) -> int:
+        return func(x, y, max_threshold)
 
-# TODO:: [Add statistics]
+    distance.max_threshold = max_threshold # type: ignore[attr-defined]
+    # levenshtein lookups are indexed by TypoClient
+    distance.mode = mode # type: ignore[attr-defined]
+    # Scores a whole PackedNames in one call, picked up by TypoClient
+    if func is levenshtein:
+        distance.batch = partial(batch_levenshtein, cutoff=max_threshold) # type: ignore[attr-defined]
+    else:
+        distance.batch = partial(batch_map, func, cutoff=max_threshold) # type: ignore[attr-defined]
+        # Only runs the slow python distances on the few levenshtein nearest names
+        distance.top = partial(rerank_top, func, cutoff=max_threshold) # type: ignore[attr-defined]
+    return distance
 
 class TypoSuggest(Cog):
-    def __init__(self, bot: AnyBot, distance_func: Callable[[str, str], int] = None, cache: CacheABC = None, detect_sub_cmd_typo: bool = False) -> None:
+    def __init__(self, bot: AnyBot, distance_func: Callable[[str, str], int] = None, cache: CacheABC = None, detect_sub_cmd_typo: bool = False, top: Optional[int] = None, enabled: Optional[Callable[[Context], Awaitable[bool]]] = None) -> None:
         if distance_func is None:
             distance_func = similarity_func_factory(5)
         self.bot = bot
         self.typo_client = bot.typo_client = TypoClient(bot, distance_func, cache)
         self.sub_cmd_typo = detect_sub_cmd_typo
+        # Only keep the best `top` suggestions, all of them if None
+        self.top = top
+        # Typos are skipped in contexts this returns False for, e.g a per guild setting
+        self.enabled = enabled
+
+    @property
+    def stats(self) -> TypoStats:
+        return self.typo_client.stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return a snapshot of the typo statistics, see :class:`TypoStats`"""
+        res = self.stats.to_dict()
+        cache = self.typo_client.cache
+        # LRUCache keeps its own counters
+        if cache is not None and hasattr(cache, "stats"):
+            res["cache"] = {"size": len(cache), **vars(cache.stats)} # type: ignore[arg-type]
+        return res
+
+    def _dispatch_typo(self, ctx: Context, typo: TypoSuggestion) -> None:
+        threshold = getattr(self.typo_client.dist, "max_threshold", None)
+        names = []
+        for dist, name in typo.get_top(self.top or 3):
+            if threshold is not None and dist > threshold:
+                break
+            cmd = typo.parent.all_commands.get(name, None)
+            if cmd is not None:
+                names.append(cmd.qualified_name)
+
+        self.stats.suggest(ctx.author.id, ctx.channel.id, names)
+        self.bot.dispatch("command_typo", ctx, typo)
 
     @Cog.listener()
     async def on_command_error(self, ctx, error):
@@ -40,15 +112,70 @@ class TypoSuggest(Cog):
             return
 
         if isinstance(error, CommandNotFound):
-            typo = await self.typo_client.process_typo(ctx)
+            if self.enabled is not None and not await self.enabled(ctx):
+                return
+            typo = await self.typo_client.process_typo(ctx, self.top)
             if not typo:
                 return
-            self.bot.dispatch("command_typo", ctx, typo)
+            self._dispatch_typo(ctx, typo)
 
     @Cog.listener()
     async def on_command_completion(self, ctx):
-        if self.sub_cmd_typo:
-            typo = await self.typo_client.process_typo(ctx)
-            if not typo:
-                return
-            self.bot.dispatch("command_typo", ctx, typo)
+        self.stats.invoked(ctx.author.id, ctx.channel.id, ctx.command.qualified_name)
+
+        if not self.sub_cmd_typo or not self.may_be_sub_cmd_typo(ctx):
+            return
+        if self.enabled is not None and not await self.enabled(ctx):
+            return
+
+        typo = await self.typo_client.process_typo(ctx, self.top)
+        if not typo:
+            return
+        self._dispatch_typo(ctx, typo)
+
+    @staticmethod
+    def may_be_sub_cmd_typo(ctx: Context) -> bool:
+        """Cheap check for whether a completed invocation could hold a sub command typo
+
+        Only a group with sub commands that was passed a word it didn't
+        resolve to one can, every other command skips :meth:`TypoClient.process_typo`.
+        """
+        if ctx.invoked_subcommand is not None or ctx.subcommand_passed is None:
+            return False
+
+        cmd = ctx.command
+        return isinstance(cmd, Group) and bool(cmd.all_commands)
+
+    @is_owner()
+    @command(name="typostats", hidden=True)
+    async def typostats(self, ctx, reset: bool = False):
+        """Show typo lookup statistics, pass `yes` to reset them afterwards"""
+        stats = self.stats
+        em = Embed(title="Typo Statistics")
+        em.add_field(name="Lookups", value=(
+            f"{stats.lookups} total, {stats.coalesced} coalesced\n"
+            f"{stats.cache_hits} hits / {stats.cache_misses} misses ({stats.hit_rate:.1%})"))
+        em.add_field(name="Suggestions", value=(
+            f"{stats.accepted} of {stats.suggested} accepted ({stats.accept_rate:.1%})"))
+
+        for name, hist, unit in (
+            ("Compute", stats.compute, "µs"),
+            ("Cache Get", stats.cache_get, "µs"),
+            ("Cache Put", stats.cache_put, "µs"),
+            ("Names Scored", stats.candidates, ""),
+            ("Results", stats.results, "")):
+            if not hist.count:
+                continue
+            em.add_field(name=name, value=(
+                f"mean {hist.mean:.0f}{unit}, max {hist.max:.0f}{unit}\n"
+                f"p50 ≤{hist.percentile(50):g}{unit} p90 ≤{hist.percentile(90):g}{unit} p99 ≤{hist.percentile(99):g}{unit}"), inline=False)
+
+        cache = self.typo_client.cache
+        if cache is not None and hasattr(cache, "stats"):
+            em.add_field(name="Cache", value=(
+                f"{len(cache)} entries, {cache.stats.evictions} evictions, " # type: ignore[arg-type, attr-defined]
+                f"{cache.stats.expirations} expirations")) # type: ignore[attr-defined]
+
+        if reset:
+            stats.reset()
+        await ctx.send(embed=em)
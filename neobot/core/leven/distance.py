@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+from bisect import insort
+from functools import lru_cache
+from itertools import repeat
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+from polyleven import levenshtein
+
+from .batch import PackedNames
+from .index import NameIndex
+
+__all__ = (
+    "ADJACENT_KEY_COST",
+    "QWERTY_NEIGHBOURS",
+    "osa_distance",
+    "qwerty_distance",
+    "RERANK_FACTOR",
+    "batch_map",
+    "rerank_top"
+)
+
+# Substituting a key for one next to it only costs this much
+ADJACENT_KEY_COST = 0.5
+
+# rerank_top scores this many times the requested names
+RERANK_FACTOR = 1
+
+_QWERTY_ROWS = (
+    "1234567890-=",
+    "qwertyuiop[]",
+    "asdfghjkl;'",
+    "zxcvbnm,./"
+)
+
+def _neighbours() -> Dict[str, FrozenSet[str]]:
+    pos = {char: (row, col) for row, keys in enumerate(_QWERTY_ROWS) for col, char in enumerate(keys)}
+    res = {}
+    for char, (row, col) in pos.items():
+        near = set()
+        # rows are staggered, so a key touches col and col + 1 of the row above
+        for d_row, d_col in ((0, -1), (0, 1), (-1, 0), (-1, 1), (1, -1), (1, 0)):
+            r, c = row + d_row, col + d_col
+            if 0 <= r < len(_QWERTY_ROWS) and 0 <= c < len(_QWERTY_ROWS[r]):
+                near.add(_QWERTY_ROWS[r][c])
+        res[char] = frozenset(near)
+    return res
+
+QWERTY_NEIGHBOURS: Dict[str, FrozenSet[str]] = _neighbours()
+_NO_NEIGHBOURS: FrozenSet[str] = frozenset()
+# char: {char it may be replaced with: cost}, anything else costs 1
+_SUBSTITUTE_COST: Dict[str, Dict[str, Union[int, float]]] = {
+    char: {**dict.fromkeys(near, ADJACENT_KEY_COST), char: 0} for char, near in QWERTY_NEIGHBOURS.items()
+}
+
+@lru_cache(maxsize=256)
+def _swapped_pairs(word: str) -> FrozenSet[Tuple[str, str]]:
+    return frozenset((y, x) for x, y in zip(word, word[1:]) if x != y)
+
+def _strip_common(a: str, b: str) -> Tuple[str, str]:
+    # matching ends never need an edit, so only the middles go through the table
+    start, end = 0, min(len(a), len(b))
+    while start < end and a[start] == b[start]:
+        start += 1
+    tail = 0
+    while tail < end - start and a[-1 - tail] == b[-1 - tail]:
+        tail += 1
+    return a[start:len(a) - tail], b[start:len(b) - tail]
+
+# Both distances below lie between half the levenshtein distance and all
+# of it (every edit costs at least half of a levenshtein edit), so polyleven
+# can rule out most far away names before any python level work happens.
+
+def osa_distance(a: str, b: str, cutoff: Optional[int] = None) -> int:
+    """Optimal string alignment distance, levenshtein where swapping two adjacent characters costs 1
+
+    Distances above ``cutoff`` are reported as ``cutoff + 1``.
+    """
+    if a == b:
+        return 0
+
+    len_a, len_b = len(a), len(b)
+    if cutoff is None:
+        cutoff = max(len_a, len_b)
+    if abs(len_a - len_b) > cutoff:
+        return cutoff + 1
+
+    lev = levenshtein(a, b, int(2 * cutoff))
+    if lev > 2 * cutoff:
+        return cutoff + 1
+    # A single edit can't be a transposition
+    if lev <= 1:
+        return lev
+    # Without a swappable pair of letters there is nothing to transpose
+    if _swapped_pairs(a).isdisjoint(zip(b, b[1:])):
+        return lev if lev <= cutoff else cutoff + 1
+
+    a, b = _strip_common(a, b)
+    len_a, len_b = len(a), len(b)
+    # Only cells within ``cutoff`` of the diagonal can stay within it,
+    # everything off the band counts as already past the cutoff
+    band = int(cutoff)
+    big = cutoff + 1
+    prev2 = prev = [j if j <= band else big for j in range(len_b + 1)]
+    for i in range(1, len_a + 1):
+        char_a = a[i - 1]
+        cur = [big] * (len_b + 1)
+        if i <= band:
+            cur[0] = i
+        row_min = cur[0]
+        for j in range(max(1, i - band), min(len_b, i + band) + 1):
+            char_b = b[j - 1]
+            dist = prev[j - 1] + (char_a != char_b)
+            if prev[j] + 1 < dist:
+                dist = prev[j] + 1
+            if cur[j - 1] + 1 < dist:
+                dist = cur[j - 1] + 1
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b and prev2[j - 2] + 1 < dist:
+                dist = prev2[j - 2] + 1
+            cur[j] = dist
+            if dist < row_min:
+                row_min = dist
+
+        # Row minimums never decrease, transpositions included
+        if row_min > cutoff:
+            return cutoff + 1
+        prev2, prev = prev, cur
+
+    return prev[len_b] if prev[len_b] <= cutoff else cutoff + 1
+
+def qwerty_distance(a: str, b: str, cutoff: Optional[float] = None) -> Union[int, float]:
+    """Levenshtein distance where substituting adjacent QWERTY keys costs :data:`ADJACENT_KEY_COST`
+
+    Distances above ``cutoff`` are reported as ``cutoff + 1``.
+    """
+    if a == b:
+        return 0
+
+    len_a, len_b = len(a), len(b)
+    if cutoff is None:
+        cutoff = max(len_a, len_b)
+    if abs(len_a - len_b) > cutoff:
+        return cutoff + 1
+
+    lev = levenshtein(a, b, int(2 * cutoff))
+    if lev > 2 * cutoff:
+        return cutoff + 1
+    if lev == 1:
+        dist: Union[int, float] = 1
+        if len_a == len_b:
+            # A single substitution
+            for char_a, char_b in zip(a, b):
+                if char_a != char_b and char_b in QWERTY_NEIGHBOURS.get(char_a, _NO_NEIGHBOURS):
+                    dist = ADJACENT_KEY_COST
+        return dist if dist <= cutoff else cutoff + 1
+
+    a, b = _strip_common(a, b)
+    # Without neighbouring keys to substitute it is the levenshtein distance
+    if _NO_NEIGHBOURS.union(*map(QWERTY_NEIGHBOURS.get, a, repeat(_NO_NEIGHBOURS))).isdisjoint(b):
+        return lev if lev <= cutoff else cutoff + 1
+
+    len_a, len_b = len(a), len(b)
+    table = _SUBSTITUTE_COST
+    # Same band as osa_distance, every insertion or deletion costs a full 1
+    band = int(cutoff)
+    big = cutoff + 1
+    prev: list = [j if j <= band else big for j in range(len_b + 1)]
+    for i in range(1, len_a + 1):
+        char_a = a[i - 1]
+        costs = table.get(char_a, None) or {char_a: 0}
+        cur: list = [big] * (len_b + 1)
+        if i <= band:
+            cur[0] = i
+        row_min: Union[int, float] = cur[0]
+        for j in range(max(1, i - band), min(len_b, i + band) + 1):
+            dist = prev[j - 1] + costs.get(b[j - 1], 1)
+            if prev[j] + 1 < dist:
+                dist = prev[j] + 1
+            if cur[j - 1] + 1 < dist:
+                dist = cur[j - 1] + 1
+            cur[j] = dist
+            if dist < row_min:
+                row_min = dist
+
+        if row_min > cutoff:
+            return cutoff + 1
+        prev = cur
+
+    return prev[len_b] if prev[len_b] <= cutoff else cutoff + 1
+
+def batch_map(func: Callable[[str, str, int], Union[int, float]], typo: str, packed: PackedNames, cutoff: int) -> List[Union[int, float]]:
+    """The batch form of ``func``, the levenshtein prefilter in it does most of the work"""
+    return list(map(func, repeat(typo), packed.names, repeat(cutoff)))
+
+def rerank_top(func: Callable[[str, str, float], Union[int, float]], typo: str, index: NameIndex, num: int, cutoff: int) -> List[Tuple[Union[int, float], str]]:
+    """Return the ``num`` closest ``(distance, name)`` pairs within ``cutoff`` by ``func``, sorted
+
+    Only the ``RERANK_FACTOR * num`` levenshtein nearest names are scored by
+    ``func``, which must lie between half the levenshtein distance and all of it.
+    Names are scored nearest first until they can't beat the worst kept distance.
+    """
+    top: List[Tuple[Union[int, float], str]] = []
+    if num <= 0:
+        return top
+
+    for lev, name in index.top(typo, RERANK_FACTOR * num, cutoff):
+        limit = cutoff if len(top) < num else top[-1][0]
+        # ties may still beat the worst entry by name
+        if lev / 2 > limit:
+            break
+
+        if lev <= limit:
+            # never more than the levenshtein distance, so only a discount
+            # needs working out, both distances move in steps of a half
+            dist = func(typo, name, lev - 0.5)
+            if dist > lev:
+                dist = lev
+        else:
+            dist = func(typo, name, limit)
+            if dist > limit:
+                continue
+
+        insort(top, (dist, name))
+        if len(top) > num:
+            top.pop()
+
+    return top
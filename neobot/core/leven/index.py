@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from hashlib import blake2b
+from itertools import repeat
+from typing import Collection, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from polyleven import levenshtein
+
+from .batch import PackedNames
+
+__all__ = (
+    "NameIndex",
+)
+
+class NameIndex:
+    """Command names bucketed by their length
+
+    The levenshtein distance of two names is never less than the
+    difference of their lengths, so a lookup within ``radius`` only
+    scores the names whose length is within ``radius`` of the typo's.
+    Names are added and removed in place as commands come and go,
+    what is derived from them is rebuilt lazily after a change.
+    """
+    __slots__ = ("names", "_buckets", "_generation", "_packed")
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self.names: Set[str] = set()
+        # length: names of that length, sorted
+        self._buckets: Dict[int, List[str]] = {}
+        self._generation: Optional[int] = None
+        self._packed: Optional[PackedNames] = None
+
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __repr__(self) -> str:
+        return f"<NameIndex names={len(self.names)} lengths={len(self._buckets)}>"
+
+    @property
+    def generation(self) -> int:
+        """A digest of the names, equal across processes holding the same names"""
+        if self._generation is None:
+            digest = blake2b("\0".join(sorted(self.names)).encode(), digest_size=8).digest()
+            self._generation = int.from_bytes(digest, "big")
+        return self._generation
+
+    @property
+    def packed(self) -> PackedNames:
+        if self._packed is None:
+            self._packed = PackedNames(sorted(self.names))
+        return self._packed
+
+    def matches(self, names: Collection[str]) -> bool:
+        """Whether the index holds exactly ``names``"""
+        return len(self.names) == len(names) and self.names == names
+
+    def add(self, name: str) -> None:
+        if name in self.names:
+            return
+
+        self.names.add(name)
+        self._generation = self._packed = None
+        insort(self._buckets.setdefault(len(name), []), name)
+
+    def remove(self, name: str) -> None:
+        if name not in self.names:
+            return
+
+        self.names.discard(name)
+        self._generation = self._packed = None
+        bucket = self._buckets[len(name)]
+        del bucket[bisect_left(bucket, name)]
+        if not bucket:
+            del self._buckets[len(name)]
+
+    def _near(self, size: int, diff: int) -> Iterator[List[str]]:
+        # the buckets exactly ``diff`` characters longer or shorter than ``size``
+        buckets = self._buckets
+        for length in ((size,) if not diff else (size - diff, size + diff)):
+            bucket = buckets.get(length, None)
+            if bucket:
+                yield bucket
+
+    def search(self, typo: str, radius: int) -> List[Tuple[int, str]]:
+        """Return every ``(distance, name)`` pair within ``radius`` of ``typo``"""
+        res: List[Tuple[int, str]] = []
+        size = len(typo)
+
+        for diff in range(radius + 1):
+            for bucket in self._near(size, diff):
+                dists = map(levenshtein, repeat(typo), bucket, repeat(radius))
+                res.extend(i for i in zip(dists, bucket) if i[0] <= radius)
+
+        return res
+
+    def top(self, typo: str, num: int, cutoff: int) -> List[Tuple[int, str]]:
+        """Return the ``num`` closest ``(distance, name)`` pairs within ``cutoff``, sorted
+
+        Lengths are walked nearest first, once ``num`` names are kept the
+        cutoff drops to the worst of them, which also ends the walk early.
+        Ties are broken by name.
+        """
+        top: List[Tuple[int, str]] = []
+        if num <= 0:
+            return top
+
+        size = len(typo)
+        diff = 0
+        while diff <= cutoff:
+            for bucket in self._near(size, diff):
+                # a bucket is scored in one go, the cutoff tightens between buckets
+                dists = map(levenshtein, repeat(typo), bucket, repeat(cutoff))
+                found = [i for i in zip(dists, bucket) if i[0] <= cutoff]
+                if not found:
+                    continue
+
+                top = sorted(top + found)[:num]
+                if len(top) == num:
+                    cutoff = top[-1][0]
+            diff += 1
+
+        return top
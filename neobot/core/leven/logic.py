@@ -1,12 +1,18 @@
 from __future__ import annotations
 
-from asyncio import create_task
-from typing import Generator, TYPE_CHECKING, Callable, List, Optional, Tuple, Iterator
+from asyncio import Task, create_task, shield
+from heapq import nsmallest
+from time import perf_counter
+from typing import Any, Dict, Generator, TYPE_CHECKING, Callable, List, Optional, Set, Tuple, Iterator
+from weakref import WeakKeyDictionary, WeakSet
 
 from discord.ext.commands.core import Group, _CaseInsensitiveDict
 from discord.utils import get
 
 from ._utils import maybe_awaitable
+from .batch import PackedNames
+from .index import NameIndex
+from .stats import TypoStats
 
 if TYPE_CHECKING:
     from discord.ext.commands import Context
@@ -21,11 +27,13 @@ __all__ = (
 )
 
 class TypoSuggestion:
+    __slots__ = ("parent", "typo", "suggestions", "_sorted")
+
     suggestions: List[Tuple[int, str]]
     typo: str
     parent: GroupMixin
 
-    def __init__(self, parent: GroupMixin, typo: Optional[str] = None, suggestions: Optional[List[Tuple[int, str]]] = None) -> None:
+    def __init__(self, parent: GroupMixin, typo: Optional[str] = None, suggestions: Optional[List[Tuple[int, str]]] = None, *, is_sorted: bool = False) -> None:
         if suggestions is None:
             suggestions = []
         if typo is None:
@@ -34,6 +42,7 @@ class TypoSuggestion:
         self.parent = parent
         self.typo = typo
         self.suggestions = suggestions
+        self._sorted = is_sorted
 
     def __getitem__(self, idx: int):
         return self.suggestions[idx]
@@ -60,9 +69,14 @@ class TypoSuggestion:
         return bool(self.typo and self.parent)
 
     def sort(self) -> None:
-        self.suggestions.sort()
+        if not self._sorted:
+            self.suggestions.sort()
+            self._sorted = True
 
     def get_best(self) -> Tuple[int, str]:
+        if self._sorted:
+            return self.suggestions[0]
+
         least = self.suggestions[0]
         for i in self.suggestions:
             if i < least:
@@ -89,7 +103,24 @@ class TypoClient:
     def __init__(self, bot: AnyBot, distance_func: Callable[[str, str], int], cache: CacheABC = None) -> None:
         self.bot = bot
         self.dist = distance_func
-        self.cache: Optional[CacheABC[Tuple[str, str], List[Tuple[int, str]]]] = cache
+        # Part of every cache key, clients with other distances or thresholds
+        # may share the cache without serving each other's suggestions
+        self.variant = f"{getattr(distance_func, 'mode', getattr(distance_func, '__qualname__', ''))}:{getattr(distance_func, 'max_threshold', None)}"
+        self.cache: Optional[CacheABC[Tuple[str, int, str, Optional[int], str], List[Tuple[int, str]]]] = cache
+        # Scores every name in one call, see similarity_func_factory
+        self.batch: Optional[Callable[[str, PackedNames], List[int]]] = getattr(distance_func, "batch", None)
+        # A distance specific top-k strategy taking a typo, a NameIndex and a count
+        self.top: Optional[Callable[[str, NameIndex, int], List[Tuple[int, str]]]] = getattr(distance_func, "top", None)
+        # Capped levenshtein lookups are answered by a NameIndex per GroupMixin
+        self.radius: Optional[int] = getattr(distance_func, "max_threshold", None) if getattr(distance_func, "mode", None) == "levenshtein" else None
+        self._indexes: WeakKeyDictionary[GroupMixin, NameIndex] = WeakKeyDictionary()
+        # Groups that report every change through sync_command
+        self._synced: WeakSet[GroupMixin] = WeakSet()
+        # Concurrent lookups of the same typo share one computation
+        self._inflight: Dict[Tuple[str, int, str, Optional[int], str], Task[List[Tuple[int, str]]]] = {}
+        # create_task only keeps weak references to the tasks
+        self._tasks: Set[Task[Any]] = set()
+        self.stats = TypoStats()
 
     @staticmethod
     def parse_content(ctx: Context) -> Optional[List[str]]:
@@ -136,6 +167,49 @@ class TypoClient:
 
         return cmd, None
 
+    def get_index(self, par: GroupMixin) -> NameIndex:
+        index = self._indexes.get(par, None)
+
+        # Groups that don't go through sync_command are compared name by name
+        if index is None or (par not in self._synced and not index.matches(par.all_commands.keys())):
+            index = self._indexes[par] = NameIndex(par.all_commands)
+
+        return index
+
+    def get_packed(self, par: GroupMixin) -> PackedNames:
+        return self.get_index(par).packed
+
+    def generation(self, par: GroupMixin) -> int:
+        # Cache keys are tagged with the generation of the command names they
+        # were computed from, so changes make old entries unreachable.
+        return self.get_index(par).generation
+
+    def invalidate(self, par: Optional[GroupMixin] = None) -> None:
+        """Forget the index of ``par`` and what was derived from it, everything if None"""
+        if par is None:
+            self._indexes.clear()
+            return
+
+        self._indexes.pop(par, None)
+
+    def sync_command(self, par: GroupMixin, command: Command) -> None:
+        """Update the index of ``par`` after ``command`` was added to or removed from it"""
+        self._synced.add(par)
+        index = self._indexes.get(par, None)
+        # Built lazily on the next lookup
+        if index is None:
+            return
+
+        names = [command.name, *command.aliases]
+        if isinstance(par.all_commands, _CaseInsensitiveDict):
+            names = [i.casefold() for i in names]
+
+        for name in names:
+            if name in par.all_commands:
+                index.add(name)
+            else:
+                index.remove(name)
+
     def _gen_suggests(self, par: Group, typo: str) -> List[Tuple[int, str]]:
         suggestions = []
         distance = self.dist
@@ -143,33 +217,94 @@ class TypoClient:
         if isinstance(par.all_commands, _CaseInsensitiveDict):
             typo = typo.casefold()
 
+        if self.batch is not None:
+            packed = self.get_packed(par)
+            return list(zip(self.batch(typo, packed), packed.names))
+
         for i in par.all_commands:
             suggestions.append((distance(typo, i), i))
 
         return suggestions
 
-    async def generate_suggestions(self, par: GroupMixin, typo: Optional[str]) -> Optional[List[Tuple[int, str]]]:
+    def _gen_top(self, par: Group, typo: str, num: int) -> List[Tuple[int, str]]:
+        if isinstance(par.all_commands, _CaseInsensitiveDict):
+            typo = typo.casefold()
+
+        if self.radius is not None:
+            # Only names within the threshold are returned
+            return self.get_index(par).top(typo, num, self.radius)
+
+        if self.top is not None:
+            return self.top(typo, self.get_index(par), num)
+
+        distance = self.dist
+        return nsmallest(num, ((distance(typo, i), i) for i in par.all_commands))
+
+    async def generate_suggestions(self, par: GroupMixin, typo: Optional[str], top: Optional[int] = None) -> Optional[List[Tuple[int, str]]]:
+        """Return the suggestions for ``typo``, only the best ``top`` ones in order if given"""
         if not typo:
             return None
 
-        # Use a tuple for string pigeonhole opts to work
-        if self.cache is not None:
-            cached: Optional[List[Tuple[int, str]]] = await maybe_awaitable(self.cache.get((str(par), typo)))
-            if cached is not None and isinstance(cached, list):
-                return cached.copy()
+        self.stats.lookups += 1
+        gen = lambda: self._compute(par, typo, top)
+
+        if self.cache is None:
+            return gen()
 
-            suggest = self._gen_suggests(par, typo)
+        # Use a tuple for string pigeonhole opts to work
+        key = (getattr(par, "qualified_name", ""), self.generation(par), typo, top, self.variant)
 
-            # this might be a web request, we want sugestions to be responsive
-            create_task(maybe_awaitable(self.cache.put((str(par), typo), suggest)))
-            return suggest
+        lookup = self._inflight.get(key, None)
+        if lookup is None:
+            lookup = self._inflight[key] = create_task(self._cached_gen(key, gen))
+            lookup.add_done_callback(lambda _: self._inflight.pop(key, None))
         else:
-            return self._gen_suggests(par, typo)
+            self.stats.coalesced += 1
+
+        # one cancelled caller must not cancel the others
+        return (await shield(lookup)).copy()
 
-    async def process_typo(self, ctx: Context) -> Optional[TypoSuggestion]:
+    def _compute(self, par: GroupMixin, typo: str, top: Optional[int]) -> List[Tuple[int, str]]:
+        start = perf_counter()
+        if top is None:
+            suggest = self._gen_suggests(par, typo) # type: ignore[arg-type]
+        else:
+            suggest = self._gen_top(par, typo, top) # type: ignore[arg-type]
+
+        stats = self.stats
+        stats.compute.record((perf_counter() - start) * 1e6)
+        stats.candidates.record(len(par.all_commands))
+        stats.results.record(len(suggest))
+        return suggest
+
+    async def _cached_gen(self, key: Tuple[str, int, str, Optional[int], str], gen: Callable[[], List[Tuple[int, str]]]) -> List[Tuple[int, str]]:
+        stats = self.stats
+        start = perf_counter()
+        cached: Optional[List[Tuple[int, str]]] = await maybe_awaitable(self.cache.get(key)) # type: ignore[union-attr]
+        stats.cache_get.record((perf_counter() - start) * 1e6)
+
+        if cached is not None and isinstance(cached, list):
+            stats.cache_hits += 1
+            return cached.copy()
+
+        stats.cache_misses += 1
+        suggest = gen()
+
+        # this might be a web request, we want sugestions to be responsive
+        task = create_task(self._timed_put(key, suggest))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return suggest
+
+    async def _timed_put(self, key: Tuple[str, int, str, Optional[int], str], suggest: List[Tuple[int, str]]) -> None:
+        start = perf_counter()
+        await maybe_awaitable(self.cache.put(key, suggest)) # type: ignore[union-attr]
+        self.stats.cache_put.record((perf_counter() - start) * 1e6)
+
+    async def process_typo(self, ctx: Context, top: Optional[int] = None) -> Optional[TypoSuggestion]:
         loc = self.resolve_max(self.parse_content(ctx))
 
         if loc is None:
             return None
 
-        return TypoSuggestion(*loc, await self.generate_suggestions(*loc))
\ No newline at end of file
+        return TypoSuggestion(*loc, await self.generate_suggestions(*loc, top), is_sorted=top is not None)
\ No newline at end of file
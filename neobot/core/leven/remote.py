@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import marshal
+from collections import deque
+from time import monotonic
+from typing import (TYPE_CHECKING, Any, Deque, Dict, Iterable, List, Mapping,
+                    Optional, Sequence, Set, Tuple, TypeVar, Union, overload)
+from urllib.parse import urlsplit
+
+from .cache import CacheABC, K, LRUCache, V
+
+if TYPE_CHECKING:
+    from asyncio import StreamReader, StreamWriter
+
+T = TypeVar("T")
+
+__all__ = (
+    "RespError",
+    "RespConnection",
+    "RemoteCache",
+    "MemoryCacheServer"
+)
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the value encoding changes
+_FORMAT = b"\x01"
+
+Arg = Union[bytes, str, int]
+
+class RespError(Exception):
+    """An error reply from the server"""
+
+def _encode_command(args: Sequence[Arg]) -> bytes:
+    buf = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = b"%d" % arg
+        buf.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(buf)
+
+async def _read_reply(reader: StreamReader) -> Any:
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        return RespError(rest.decode(errors="replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(size)]
+
+    raise ConnectionError(f"Malformed reply {line!r}")
+
+class RespConnection:
+    """A minimal pipelined client for the redis protocol (RESP)
+
+    Commands are written as soon as they are issued and replies are matched
+    to them in order by a single reader task, so concurrent callers share
+    the connection without waiting on each other's round-trips.
+    """
+    def __init__(self, host: str = "localhost", port: int = 6379, *, password: Optional[str] = None, db: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self._reader: Optional[StreamReader] = None
+        self._writer: Optional[StreamWriter] = None
+        self._waiters: Deque[asyncio.Future[Any]] = deque()
+        self._read_task: Optional[asyncio.Task[None]] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_url(cls, url: str) -> RespConnection:
+        """Create a connection from a ``redis://[:password@]host[:port][/db]`` url"""
+        parts = urlsplit(url)
+        db = parts.path.strip("/")
+        return cls(parts.hostname or "localhost", parts.port or 6379, password=parts.password, db=int(db) if db else 0)
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self) -> None:
+        async with self._lock:
+            if self.connected:
+                return
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+            setup: List[Sequence[Arg]] = []
+            if self.password:
+                setup.append(("AUTH", self.password))
+            if self.db:
+                setup.append(("SELECT", self.db))
+            # Queued before releasing the lock so they go out before anything else
+            futs = self._send(setup)
+
+        for res in await asyncio.gather(*futs, return_exceptions=True):
+            if isinstance(res, BaseException):
+                raise res
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._fail_waiters(ConnectionError("Connection closed"))
+
+    def _fail_waiters(self, exc: BaseException) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def _read_loop(self) -> None:
+        reader = self._reader
+        try:
+            while True:
+                reply = await _read_reply(reader) # type: ignore[arg-type]
+                fut = self._waiters.popleft()
+                if fut.done():
+                    continue
+                if isinstance(reply, RespError):
+                    fut.set_exception(reply)
+                else:
+                    fut.set_result(reply)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._fail_waiters(ConnectionError(f"Lost connection to {self.host}:{self.port}: {exc!r}"))
+
+    async def execute_many(self, commands: Sequence[Sequence[Arg]]) -> List[Any]:
+        """Send every command in one write and return their replies in order
+
+        Error replies are returned as :class:`RespError` instances instead of being raised.
+        """
+        if not self.connected:
+            await self.connect()
+
+        futs = self._send(commands)
+        await self._writer.drain() # type: ignore[union-attr]
+        return await asyncio.gather(*futs, return_exceptions=True)
+
+    def _send(self, commands: Sequence[Sequence[Arg]]) -> List[asyncio.Future[Any]]:
+        loop = asyncio.get_running_loop()
+        futs = []
+        for _ in commands:
+            fut = loop.create_future()
+            self._waiters.append(fut)
+            futs.append(fut)
+
+        if commands:
+            self._writer.write(b"".join(_encode_command(i) for i in commands)) # type: ignore[union-attr]
+        return futs
+
+    async def execute(self, *args: Arg) -> Any:
+        res = (await self.execute_many((args,)))[0]
+        if isinstance(res, BaseException):
+            raise res
+        return res
+
+class RemoteCache(CacheABC[K, V]):
+    """A cache shared through a redis compatible server
+
+    Lookups go through a local :class:`LRUCache` first (the near cache),
+    misses and writes made in the same event loop iteration are batched
+    into a single ``MGET`` and one pipelined write respectively.
+
+    Values are serialized with :mod:`marshal`, so only builtin types are
+    supported and the server must be trusted. Keys must have a stable ``repr``.
+    The cache is best effort, connection errors are logged and treated as misses.
+
+    Parameters
+    ----------
+    connection : Union[str, RespConnection]
+        A ``redis://`` url or a connection
+    namespace : str
+        Prefix for every key, caches with different semantics must not share one,
+        see :meth:`namespaced`
+    ttl : Optional[float]
+        Seconds after which remote entries expire
+    near : Optional[LRUCache]
+        The near cache, by default an ``LRUCache(1024)``. Pass one with a
+        ttl if other processes may overwrite entries.
+    """
+    def __init__(self, connection: Union[str, RespConnection], *, namespace: str = "neobot", ttl: Optional[float] = None, near: Optional[LRUCache] = None) -> None:
+        if isinstance(connection, str):
+            connection = RespConnection.from_url(connection)
+        self.conn = connection
+        self.namespace = namespace.encode()
+        self.ttl = ttl
+        self.near: LRUCache = LRUCache(1024) if near is None else near
+        self._gets: Dict[bytes, asyncio.Future[Optional[bytes]]] = {}
+        self._puts: Dict[bytes, bytes] = {}
+        self._put_waiters: List[asyncio.Future[None]] = []
+        self._flushing = False
+        self._tasks: Set[asyncio.Task[None]] = set()
+
+    def __repr__(self) -> str:
+        return f"<RemoteCache {self.conn.host}:{self.conn.port} namespace={self.namespace.decode()!r}>"
+
+    def namespaced(self, namespace: str) -> RemoteCache:
+        """Return a cache sharing this connection, its keys are nested under ``namespace``
+
+        It gets its own near cache, sized like this one.
+        """
+        return type(self)(
+            self.conn,
+            namespace=f"{self.namespace.decode()}:{namespace}",
+            ttl=self.ttl,
+            near=LRUCache(self.near.maxsize, ttl=self.near.ttl, maxbytes=self.near.maxbytes, sizeof=self.near.sizeof)
+        )
+
+    def _key(self, key: K) -> bytes:
+        return self.namespace + b":" + repr(key).encode()
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        return _FORMAT + marshal.dumps(value)
+
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        if data[:1] != _FORMAT:
+            raise ValueError("Unknown cache value format")
+        return marshal.loads(data[1:])
+
+    def _schedule_flush(self) -> None:
+        if not self._flushing:
+            self._flushing = True
+            # wait one loop iteration so concurrent callers join the batch
+            asyncio.get_running_loop().call_soon(self._start_flush)
+
+    def _start_flush(self) -> None:
+        task = asyncio.ensure_future(self._flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self) -> None:
+        self._flushing = False
+        gets, self._gets = self._gets, {}
+        puts, self._puts = self._puts, {}
+        put_waiters, self._put_waiters = self._put_waiters, []
+
+        commands: List[Sequence[Arg]] = []
+        if gets:
+            commands.append(("MGET", *gets))
+        for key, data in puts.items():
+            if self.ttl is None:
+                commands.append(("SET", key, data))
+            else:
+                commands.append(("SET", key, data, "PX", int(self.ttl * 1000)))
+
+        if not commands:
+            return
+
+        try:
+            replies = await self.conn.execute_many(commands)
+        except Exception as exc:
+            logger.warning("Remote cache request failed: %r", exc)
+            replies = [exc] * len(commands)
+
+        if gets:
+            values = replies[0]
+            if isinstance(values, BaseException):
+                values = [None] * len(gets)
+            for fut, data in zip(gets.values(), values):
+                if not fut.done():
+                    fut.set_result(data)
+
+        for waiter in put_waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _fetch(self, keys: Iterable[bytes]) -> List[Optional[bytes]]:
+        loop = asyncio.get_running_loop()
+        futs = []
+        for key in keys:
+            fut = self._gets.get(key, None)
+            if fut is None:
+                fut = self._gets[key] = loop.create_future()
+            futs.append(fut)
+        self._schedule_flush()
+        return await asyncio.gather(*futs)
+
+    def _decode(self, key: K, data: Optional[bytes]) -> Any:
+        if data is None:
+            return None
+        try:
+            value = self.loads(data)
+        except Exception:
+            logger.warning("Dropping undecodable remote cache value for %r", key)
+            return None
+        self.near.put(key, value)
+        return value
+
+    @overload
+    async def get(self, key: K) -> Optional[V]:
+        ...
+
+    @overload
+    async def get(self, key: K, default: T) -> Union[V, T]:
+        ...
+
+    async def get(self, key: K, default: Optional[T] = None) -> Union[Optional[V], T]:
+        value = self.near.get(key, None)
+        if value is not None:
+            return value
+
+        value = self._decode(key, (await self._fetch((self._key(key),)))[0])
+        return default if value is None else value
+
+    async def get_many(self, keys: Iterable[K]) -> Dict[K, V]:
+        """Get many keys at once, missing keys are left out"""
+        res: Dict[K, V] = {}
+        missing: List[K] = []
+        for key in keys:
+            value = self.near.get(key, None)
+            if value is None:
+                missing.append(key)
+            else:
+                res[key] = value
+
+        if missing:
+            for key, data in zip(missing, await self._fetch(map(self._key, missing))):
+                value = self._decode(key, data)
+                if value is not None:
+                    res[key] = value
+
+        return res
+
+    async def put(self, key: K, value: V) -> None:
+        await self.put_many({key: value})
+
+    async def put_many(self, items: Mapping[K, V]) -> None:
+        for key, value in items.items():
+            self.near.put(key, value)
+            self._puts[self._key(key)] = self.dumps(value)
+
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._put_waiters.append(fut)
+        self._schedule_flush()
+        await fut
+
+    def forget(self, key: K) -> None:
+        """Drop ``key`` from the near cache only"""
+        self.near.pop(key, None)
+
+    def forget_all(self) -> None:
+        """Empty the near cache, the remote entries are kept"""
+        self.near.clear()
+
+    async def delete(self, key: K) -> None:
+        self.near.pop(key, None)
+        try:
+            await self.conn.execute("DEL", self._key(key))
+        except Exception as exc:
+            logger.warning("Remote cache request failed: %r", exc)
+
+    async def close(self) -> None:
+        await self.conn.close()
+
+class MemoryCacheServer:
+    """An in-memory stand-in for a redis server
+
+    Only understands the handful of commands :class:`RemoteCache` uses,
+    meant for tests and local development.
+    """
+    def __init__(self) -> None:
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[StreamWriter] = set()
+        self._handlers: Set[asyncio.Task] = set()
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1] # type: ignore[union-attr]
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> MemoryCacheServer:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            for writer in self._clients:
+                writer.close()
+            # they end on their own once their connection is closed, left
+            # running they'd be cancelled at loop shutdown and logged as errors
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key, None)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def _run(self, cmd: List[bytes]) -> bytes:
+        self.commands += 1
+        name = cmd[0].upper()
+
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name in {b"SELECT", b"AUTH"}:
+            return b"+OK\r\n"
+        if name == b"GET":
+            return _encode_bulk(self._get(cmd[1]))
+        if name == b"MGET":
+            return b"*%d\r\n" % (len(cmd) - 1) + b"".join(_encode_bulk(self._get(i)) for i in cmd[1:])
+        if name == b"SET":
+            expiry = None
+            if len(cmd) == 5 and cmd[3].upper() == b"PX":
+                expiry = monotonic() + int(cmd[4]) / 1000
+            self.data[cmd[1]] = (cmd[2], expiry)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return b":%d\r\n" % sum(self.data.pop(i, None) is not None for i in cmd[1:])
+        if name == b"FLUSHDB":
+            self.data.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    async def _handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._handlers.add(task)
+            task.add_done_callback(self._handlers.discard)
+        self._clients.add(writer)
+        try:
+            while True:
+                cmd = await _read_reply(reader)
+                writer.write(self._run(cmd))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+def _encode_bulk(data: Optional[bytes]) -> bytes:
+    if data is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(data), data)
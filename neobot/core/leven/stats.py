@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+__all__ = (
+    "LATENCY_BUCKETS",
+    "COUNT_BUCKETS",
+    "Histogram",
+    "TypoStats"
+)
+
+# Upper bounds, in microseconds
+LATENCY_BUCKETS: Tuple[float, ...] = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+COUNT_BUCKETS: Tuple[float, ...] = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class Histogram:
+    """A histogram with fixed bucket bounds
+
+    Recording a value is a bisect and an increment, values above the
+    last bound land in an overflow bucket.
+    """
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.bounds: Tuple[float, ...] = tuple(bounds)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total: float = 0
+        self.max: float = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __repr__(self) -> str:
+        return f"<Histogram count={self.count} mean={self.mean:.1f} max={self.max:.1f}>"
+
+    def record(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """Return the upper bound of the bucket holding the ``pct``th percentile
+
+        Values in the overflow bucket are reported as the largest value seen.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = pct / 100 * self.count
+        seen = 0
+        for bound, num in zip(self.bounds, self.counts):
+            seen += num
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """Return ``(upper bound, count)`` pairs, the overflow bucket is bound by ``inf``"""
+        return list(zip((*self.bounds, float("inf")), self.counts))
+
+    def clear(self) -> None:
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": self.buckets()
+        }
+
+class TypoStats:
+    """Counters and histograms describing typo lookups
+
+    Attributes
+    ----------
+    lookups : int
+        Suggestion lookups, cached or not
+    cache_hits : int
+        Lookups answered by the cache
+    cache_misses : int
+        Lookups that had to be computed
+    coalesced : int
+        Lookups that waited on an identical lookup already in flight
+    compute : Histogram
+        Microseconds spent scoring names
+    cache_get : Histogram
+        Microseconds spent reading the cache
+    cache_put : Histogram
+        Microseconds spent writing to the cache, off the response path
+    candidates : Histogram
+        Names scored per computed lookup
+    results : Histogram
+        Suggestions returned per computed lookup
+    suggested : int
+        Typos that were answered with suggestions
+    accepted : int
+        Suggestions the user went on to invoke within :attr:`accept_window` seconds
+    """
+    def __init__(self, accept_window: float = 60.0, max_pending: int = 1024) -> None:
+        self.accept_window = accept_window
+        self.max_pending = max_pending
+
+        self.lookups = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced = 0
+        self.suggested = 0
+        self.accepted = 0
+
+        self.compute = Histogram(LATENCY_BUCKETS)
+        self.cache_get = Histogram(LATENCY_BUCKETS)
+        self.cache_put = Histogram(LATENCY_BUCKETS)
+        self.candidates = Histogram(COUNT_BUCKETS)
+        self.results = Histogram(COUNT_BUCKETS)
+
+        # (author id, channel id): (suggested qualified names, deadline)
+        self._pending: OrderedDict[Tuple[int, int], Tuple[FrozenSet[str], float]] = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"<TypoStats lookups={self.lookups} hit_rate={self.hit_rate:.2%} accept_rate={self.accept_rate:.2%}>"
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+    @property
+    def accept_rate(self) -> float:
+        return self.accepted / self.suggested if self.suggested else 0.0
+
+    def suggest(self, author_id: int, channel_id: int, names: Iterable[str]) -> None:
+        """Remember that ``names`` were suggested to an author in a channel"""
+        names = frozenset(names)
+        if not names:
+            return
+
+        self.suggested += 1
+        key = (author_id, channel_id)
+        self._pending.pop(key, None)
+        self._pending[key] = (names, monotonic() + self.accept_window)
+        if len(self._pending) > self.max_pending:
+            self._pending.popitem(last=False)
+
+    def invoked(self, author_id: int, channel_id: int, name: str) -> bool:
+        """Record that ``name`` was invoked, returns whether it was an accepted suggestion"""
+        if not self._pending:
+            return False
+
+        pending = self._pending.pop((author_id, channel_id), None)
+        if pending is None:
+            return False
+
+        names, deadline = pending
+        if name in names and monotonic() <= deadline:
+            self.accepted += 1
+            return True
+        return False
+
+    def reset(self) -> None:
+        self.lookups = self.cache_hits = self.cache_misses = self.coalesced = 0
+        self.suggested = self.accepted = 0
+        for hist in (self.compute, self.cache_get, self.cache_put, self.candidates, self.results):
+            hist.clear()
+        self._pending.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "hit_rate": self.hit_rate,
+            "coalesced": self.coalesced,
+            "suggested": self.suggested,
+            "accepted": self.accepted,
+            "accept_rate": self.accept_rate,
+            "compute": self.compute.to_dict(),
+            "cache_get": self.cache_get.to_dict(),
+            "cache_put": self.cache_put.to_dict(),
+            "candidates": self.candidates.to_dict(),
+            "results": self.results.to_dict()
+        }
@@ -1 +1,2 @@
 from .webhook import *
+from .jsonl import *
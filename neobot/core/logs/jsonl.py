@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import json
+import os
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging import NOTSET, Formatter, Handler, LogRecord
+from threading import Condition, Thread
+from typing import TYPE_CHECKING, Any, BinaryIO, Deque, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from discord.ext.commands import Context
+
+__all__ = (
+    "command_context",
+    "JsonLinesHandler"
+)
+
+# The context of the command being invoked, set by NeoBase.invoke.
+# Tasks started by the command, error handlers included, inherit it
+command_context: ContextVar[Optional[Context]] = ContextVar("neobot_command_context", default=None)
+
+# Attributes every record has, anything else was passed with extra=
+_STANDARD = frozenset(vars(LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonLinesHandler(Handler):
+    """A handler writing records to a file as JSON lines, one object per record
+
+    Records logged during a command get the fields of
+    :meth:`EmbedContext.log_fields`, e.g guild, command and latency_ms.
+    Fields passed with ``extra=`` are kept too.
+
+    :meth:`emit` only copies what can't wait into a bounded buffer.
+    Serialising and writing happens in batches on a background thread,
+    so the event loop never waits on the disk. Records arriving while
+    the buffer is full are dropped and counted.
+
+    Parameters
+    ----------
+    path : Union[str, os.PathLike]
+        The file to append to
+    max_bytes : int
+        Rotate once the file reaches this size, by default 64 MiB, never rotated if 0
+    backup_count : int
+        Rotated files kept as ``path.1`` to ``path.N``, by default 5
+    max_buffer : int
+        Records waiting to be written at most, by default 10000
+    flush_interval : float
+        Seconds the writer waits to collect a batch, by default 1
+
+    Attributes
+    ----------
+    written : int
+        Records written
+    dropped : int
+        Records dropped because the buffer was full or serialising them failed
+    rotations : int
+        Times the file was rotated
+    """
+    # Wake the writer early once this many records wait
+    BATCH = 512
+    # Seconds flush and close wait for the writer
+    FLUSH_TIMEOUT = 5.0
+
+    def __init__(self, path: Union[str, os.PathLike], level: Union[int, str] = NOTSET, *, max_bytes: int = 64 * 1024 * 1024, backup_count: int = 5, max_buffer: int = 10000, flush_interval: float = 1.0) -> None:
+        super().__init__(level=level)
+        self.path = os.fspath(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        # Only used for tracebacks
+        self._exc_formatter = Formatter()
+
+        # (record, message, command and extra fields)
+        self._buf: Deque[Tuple[LogRecord, str, Optional[Dict[str, Any]]]] = deque()
+        self._cond = Condition()
+        self._writing = False
+        self._closing = False
+
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+        self._stream: Optional[BinaryIO] = None
+        self._size = 0
+        self._open()
+        self._thread = Thread(target=self._run, name="neobot-jsonlog", daemon=True)
+        self._thread.start()
+
+    def __repr__(self) -> str:
+        return f"<JsonLinesHandler {self.path!r} written={self.written} dropped={self.dropped}>"
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": len(self._buf),
+            "rotations": self.rotations,
+            "size": self._size
+        }
+
+    ## Logging thread ##
+    def emit(self, record: LogRecord) -> None:
+        try:
+            # the context only exists here, and the args may change after the logging call
+            ctx = command_context.get()
+            log_fields = getattr(ctx, "log_fields", None)
+            fields = log_fields() if log_fields is not None else None
+            # copied here, other handlers' formatters add to the record as it is written
+            extra = {k: v for k, v in record.__dict__.items() if k not in _STANDARD}
+            if extra:
+                fields = {**extra, **fields} if fields else extra
+            item = (record, record.getMessage(), fields)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._cond:
+            if len(self._buf) >= self.max_buffer or self._closing:
+                self.dropped += 1
+                return
+            self._buf.append(item)
+            if len(self._buf) == self.BATCH:
+                self._cond.notify()
+
+    def flush(self) -> None:
+        """Block until everything buffered so far is written, don't call this on the event loop"""
+        with self._cond:
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._buf and not self._writing, self.FLUSH_TIMEOUT)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(self.FLUSH_TIMEOUT)
+        if self._stream is not None and not self._thread.is_alive():
+            self._stream.close()
+            self._stream = None
+        super().close()
+
+    ## Writer thread ##
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._buf and not self._closing:
+                    self._cond.wait(self.flush_interval)
+                batch, self._buf = self._buf, deque()
+                closing = self._closing
+                self._writing = bool(batch)
+
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    with self._cond:
+                        self._writing = False
+                        self._cond.notify_all()
+            elif closing:
+                return
+
+    def _write(self, batch: Deque[Tuple[LogRecord, str, Optional[Dict[str, Any]]]]) -> None:
+        lines: List[str] = []
+        failed = 0
+        for item in batch:
+            try:
+                lines.append(self.to_json(*item))
+            except Exception:
+                failed += 1
+        if failed:
+            with self._cond:
+                self.dropped += failed
+        if not lines:
+            return
+
+        # rotated as soon as a file fills up, not only between batches
+        chunk: List[bytes] = []
+        size = self._size
+        for line in lines:
+            data = (line + "\n").encode("utf-8")
+            chunk.append(data)
+            size += len(data)
+            if self.max_bytes and size >= self.max_bytes:
+                self._write_chunk(chunk, rotate=True)
+                chunk, size = [], self._size
+        if chunk:
+            self._write_chunk(chunk)
+
+    def _write_chunk(self, chunk: List[bytes], rotate: bool = False) -> None:
+        data = b"".join(chunk)
+        try:
+            if self._stream is None:
+                self._open()
+            self._stream.write(data) # type: ignore[union-attr]
+            self._stream.flush() # type: ignore[union-attr]
+        except OSError:
+            with self._cond:
+                self.dropped += len(chunk)
+            return
+
+        self.written += len(chunk)
+        self._size += len(data)
+        if rotate:
+            try:
+                self._rotate()
+            except OSError:
+                # keep appending to whatever is there, the next chunk tries again
+                if self._stream is None:
+                    self._open()
+
+    def to_json(self, record: LogRecord, message: str, fields: Optional[Dict[str, Any]]) -> str:
+        data: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": message
+        }
+        if fields:
+            data.update(fields)
+
+        if record.exc_info:
+            data["exc"] = record.exc_text or self._exc_formatter.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = record.stack_info
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+    def _open(self) -> None:
+        self._stream = open(self.path, "ab")
+        self._size = self._stream.tell()
+
+    def _rotate(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+        self.rotations += 1
+        self._open()
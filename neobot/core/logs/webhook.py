@@ -1,14 +1,25 @@
+from __future__ import annotations
+
+import json
 import os
+import random
+import sys
+from asyncio import CancelledError, TimeoutError, run_coroutine_threadsafe, sleep, wait_for
 from asyncio.events import get_running_loop
 from asyncio.queues import Queue
+from collections import OrderedDict
 from dataclasses import dataclass
-from datetime import datetime
-from logging import NOTSET, Formatter, Handler
-from typing import TYPE_CHECKING, Final, Literal, Optional, Union, final
+from datetime import datetime, timezone
+from logging import ERROR, NOTSET, Formatter, Handler
+from threading import get_ident
+from time import monotonic
+from traceback import walk_tb
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Literal, Optional, Tuple, Union, final
+from urllib.request import Request, urlopen
 
+from aiohttp import ClientError
 from aiohttp.client import ClientSession
-from discord import (AsyncWebhookAdapter, Colour, Embed,
-                     RequestsWebhookAdapter, Webhook)
+from discord import Colour, Embed
 
 if TYPE_CHECKING:
     from logging import LogRecord
@@ -17,6 +28,9 @@ wh_log = bool(os.getenv("WEBHOOK_LOGS"))
 
 __all__ = (
     "WebHookUrl",
+    "fingerprint",
+    "code_block",
+    "EmbedPayload",
     "WebHookHandler",
     "EmbedFormatter"
 )
@@ -31,59 +45,568 @@ class WebHookUrl:
         return f"https://discord.com/api/webhooks/{self.id}/{self.token}"
 
 
+def fingerprint(record: LogRecord, frames: int = 3) -> Tuple[Hashable, ...]:
+    """Identify what a record is about, records with equal fingerprints are repeats
+
+    Exceptions are identified by their type and the ``frames`` innermost
+    frames of their traceback, the innermost cause of a chain is used,
+    e.g the error a CommandInvokeError wraps. Other records by the line
+    that logged them and their message, a line logging varying messages
+    only repeats itself when a message does.
+    """
+    exc = record.exc_info[1] if record.exc_info else None
+    if exc is None:
+        return (record.name, record.levelno, record.pathname, record.lineno, record.getMessage())
+
+    while exc.__cause__ is not None:
+        exc = exc.__cause__
+    # walk_tb doesn't read source lines, unlike extract_tb
+    tb = [(frame.f_code.co_filename, lineno, frame.f_code.co_name) for frame, lineno in walk_tb(exc.__traceback__)]
+    return (type(exc).__module__, type(exc).__qualname__, *tb[-frames:])
+
+def code_block(text: str, limit: int = 4096) -> str:
+    """Fence ``text`` in a code block at most ``limit`` characters long
+
+    Fences in the text are broken up with a zero width space. Text that
+    doesn't fit loses its middle, the message and the innermost frames
+    of a traceback are the useful parts.
+    """
+    # "```\n" and "\n```"
+    budget = limit - 8
+    if len(text) > budget:
+        # escaping only makes it longer, so cut first and copy once
+        head = budget // 3
+        text = text[:head] + "\n...\n" + text[len(text) - (budget - head - 5):]
+    if "```" in text:
+        text = text.replace("```", "`\u200b``")
+        if len(text) > budget:
+            text = text[:budget - 3] + "..."
+    return f"```\n{text}\n```"
+
+class EmbedPayload:
+    """A log record waiting to be sent as an embed, see :class:`EmbedFormatter`
+
+    The description, which may hold a traceback, is only
+    rendered when the sender first needs it.
+    """
+    __slots__ = ("formatter", "record", "message", "title", "colour", "created", "_description")
+
+    def __init__(self, formatter: EmbedFormatter, record: LogRecord, message: str, title: str, colour: Optional[int]) -> None:
+        self.formatter = formatter
+        self.record = record
+        self.message = message
+        self.title = title
+        self.colour = colour
+        self.created: float = record.created
+        self._description: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return f"<EmbedPayload title={self.title!r}>"
+
+    def __len__(self) -> int:
+        return len(self.title) + len(self.description)
+
+    @property
+    def description(self) -> str:
+        if self._description is None:
+            self._description = self.formatter.render(self)
+            # the record isn't needed anymore, nor are the frames it holds
+            self.record = None # type: ignore[assignment]
+        return self._description
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(self.formatter.template)
+        data["title"] = self.title
+        data["description"] = self.description
+        data["timestamp"] = datetime.fromtimestamp(self.created, timezone.utc).isoformat()
+        if self.colour is not None:
+            data["color"] = self.colour
+        return data
+
+class _Summary(Embed):
+    """The embed reporting suppressed or repeated records"""
+    __slots__ = ()
+
+class _Seen:
+    """A fingerprint sent in full, and the repeats since the last roll up"""
+    __slots__ = ("name", "level", "label", "count", "last")
+
+    def __init__(self, name: str, level: str, label: str, last: float) -> None:
+        self.name = name
+        self.level = level
+        self.label = label
+        self.count = 0
+        self.last = last
+
 class WebHookHandler(Handler):
-    session: Final[ClientSession] = ClientSession()
+    """A handler sending log records to a discord webhook as embeds
+
+    Records are queued and sent in batches of up to :attr:`MAX_EMBEDS` embeds
+    per message, following discord's rate limit headers. Records arriving
+    while the queue is full are not formatted, they are counted by logger,
+    level and message and reported in one "suppressed" embed instead.
+
+    Repeats of a record, see :func:`fingerprint`, are not sent again within
+    ``dedup_window`` seconds of it. They are counted and rolled up into one
+    embed every window instead, a fingerprint is forgotten after a quiet window.
+    Records below ``sample_below`` can be sampled per logger.
+
+    :meth:`emit` may be called from any thread, records are handed to the
+    loop the handler was made on. :meth:`flush` from another thread waits
+    for the sender to catch up, which keeps running. On shutdown
+    :meth:`aclose` stops it and sends what is left in one message, within a deadline.
+
+    Parameters
+    ----------
+    url : Union[str, WebHookUrl]
+        The webhook to send to
+    max_queue : int
+        Embeds waiting to be sent at most, by default 1000
+    max_suppressed : int
+        Distinct kinds of suppressed records counted at most, others are only dropped
+    session : Optional[ClientSession]
+        The session to post with, one is made (and closed) by the handler if None
+    dedup_window : Optional[float]
+        Seconds repeats are rolled up for, by default 60. No deduplication if None
+    fingerprint_frames : int
+        Innermost traceback frames that are part of a fingerprint, by default 3
+    max_fingerprints : int
+        Fingerprints remembered at most, the oldest are forgotten first
+    sample_rates : Optional[Dict[str, float]]
+        Logger name: fraction of its records to keep, loggers inherit
+        the rate of their closest configured parent, by default all are kept
+    sample_below : int
+        Records at this level or above are never sampled out, by default ERROR
+
+    Attributes
+    ----------
+    sent : int
+        Records delivered to discord
+    dropped : int
+        Records never delivered on their own, suppressed or failed
+    rate_limited : int
+        Requests answered with a 429
+    deduped : int
+        Repeats that were only counted
+    sampled_out : int
+        Records skipped by sampling
+    """
+    # Discord's limits per webhook message
+    MAX_EMBEDS = 10
+    MAX_CHARS = 6000
+    # Attempts per batch before it is dropped
+    MAX_RETRIES = 5
+    # Seconds a shutdown drain may take
+    DRAIN_TIMEOUT = 5.0
 
-    def __init__(self, url: Union[str, WebHookUrl], level: Union[int, str] = NOTSET) -> None:
+    def __init__(self, url: Union[str, WebHookUrl], level: Union[int, str] = NOTSET, *, max_queue: int = 1000, max_suppressed: int = 50, session: Optional[ClientSession] = None,
+            dedup_window: Optional[float] = 60.0, fingerprint_frames: int = 3, max_fingerprints: int = 1024, sample_rates: Optional[Dict[str, float]] = None, sample_below: int = ERROR) -> None:
         super().__init__(level=level)
-        self.webhook = Webhook.from_url(str(url), adapter=AsyncWebhookAdapter(self.session))
-        self._sync_adapter = RequestsWebhookAdapter()
-        self._sync_adapter._prepare(self.webhook)
-        self.buf: Queue[Embed] = Queue()
+        self.url = str(url)
+        self.session = session
+        self._own_session = session is None
+        self.buf: Queue[Union[Embed, EmbedPayload]] = Queue(max_queue)
         self.formatter = EmbedFormatter()
 
-        self._task = get_running_loop().create_task(self.sender())
+        self.max_suppressed = max_suppressed
+        # (logger, level, message): records suppressed since the last report
+        self._suppressed: Dict[Tuple[str, str, str], int] = {}
+        # An embed that didn't fit in the last batch
+        self._carry: Optional[Union[Embed, EmbedPayload]] = None
+        # monotonic time before which nothing may be sent
+        self._blocked_until = 0.0
+
+        self.dedup_window = dedup_window
+        self.fingerprint_frames = fingerprint_frames
+        self.max_fingerprints = max_fingerprints
+        self._seen: OrderedDict[Tuple[Hashable, ...], _Seen] = OrderedDict()
+        self.sample_rates = dict(sample_rates or {})
+        self.sample_below = sample_below
+        # logger name: its resolved sample rate
+        self._rates: Dict[str, float] = {}
+
+        self.sent = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self.deduped = 0
+        # only a rough count, records are sampled on the logging threads
+        self.sampled_out = 0
+
+        # The queue and counters are only touched from this loop's thread
+        self._loop = get_running_loop()
+        self._thread = get_ident()
+        # The batch being sent, drained again if the sender is cancelled mid send
+        self._inflight: List[Union[Embed, EmbedPayload]] = []
+        self._task = self._loop.create_task(self.sender())
+        self._roller = self._loop.create_task(self.roll_up()) if dedup_window else None
+
+    @property
+    def queued(self) -> int:
+        return self.buf.qsize() + (self._carry is not None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "queued": self.queued,
+            "suppressed": sum(self._suppressed.values()),
+            "rate_limited": self.rate_limited,
+            "deduped": self.deduped,
+            "sampled_out": self.sampled_out,
+            "fingerprints": len(self._seen)
+        }
 
     def emit(self, record: LogRecord):
-        self.buf.put_nowait(self.format(record))
+        if record.levelno < self.sample_below and random.random() >= self._sample_rate(record.name):
+            self.sampled_out += 1
+            return
+
+        try:
+            fp = fingerprint(record, self.fingerprint_frames) if self.dedup_window else None
+            if get_ident() == self._thread:
+                self._enqueue(record, fp, None)
+                return
+
+            # Formatted on the logging thread, both checks are only hints
+            # here and _enqueue checks again on the loop
+            emb = None if self.buf.full() or fp in self._seen else self.format(record)
+            self._loop.call_soon_threadsafe(self._enqueue, record, fp, emb)
+        except RuntimeError:
+            # the loop is closed
+            pass
+        except Exception:
+            self.handleError(record)
+
+    def _sample_rate(self, name: str) -> float:
+        rate = self._rates.get(name, None)
+        if rate is None:
+            rate = 1.0
+            parts = name.split(".")
+            # the closest configured parent wins
+            for i in range(len(parts), -1, -1):
+                configured = self.sample_rates.get(".".join(parts[:i]), None)
+                if configured is not None:
+                    rate = configured
+                    break
+            self._rates[name] = rate
+        return rate
+
+    def set_sample_rate(self, name: str, rate: Optional[float]) -> None:
+        """Keep ``rate`` of the records of logger ``name`` and its children, all of them if None"""
+        if rate is None:
+            self.sample_rates.pop(name, None)
+        else:
+            self.sample_rates[name] = rate
+        self._rates = {}
+
+    def _enqueue(self, record: LogRecord, fp: Optional[Tuple[Hashable, ...]], emb: Optional[EmbedPayload]) -> None:
+        if fp is not None:
+            seen = self._seen.get(fp, None)
+            if seen is not None:
+                seen.count += 1
+                self.deduped += 1
+                return
+
+        if self.buf.full():
+            self._suppress(record)
+            return
+        try:
+            self.buf.put_nowait(emb or self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if fp is not None:
+            self._remember(fp, record)
+
+    def _remember(self, fp: Tuple[Hashable, ...], record: LogRecord) -> None:
+        exc = record.exc_info[1] if record.exc_info else None
+        if exc is not None:
+            while exc.__cause__ is not None:
+                exc = exc.__cause__
+            label = f"{type(exc).__name__}: {exc}"
+        else:
+            label = record.getMessage()
+        if len(label) > 200:
+            label = label[:197] + "..."
+
+        self._seen[fp] = _Seen(record.name, record.levelname, label, monotonic())
+        if len(self._seen) > self.max_fingerprints:
+            _, old = self._seen.popitem(last=False)
+            self._report_repeats(old)
+
+    def _report_repeats(self, seen: _Seen) -> None:
+        # Repeats not rolled up yet go out with the suppressed records
+        if seen.count:
+            key = (seen.name, seen.level, seen.label)
+            self._suppressed[key] = self._suppressed.get(key, 0) + seen.count
+            seen.count = 0
+
+    async def roll_up(self) -> None:
+        """Every ``dedup_window`` seconds, queue one embed counting the repeats seen since"""
+        window: float = self.dedup_window # type: ignore[assignment]
+        while True:
+            await sleep(window)
+            now = monotonic()
+            # counts keep adding up until there is room again
+            full = self.buf.full()
+            lines = []
+            for fp, seen in list(self._seen.items()):
+                if seen.count and not full:
+                    lines.append(f"{seen.count} x `{seen.name} | {seen.level}` {seen.label}")
+                    seen.count = 0
+                    # still going on, keep rolling it up
+                    seen.last = now
+                elif not seen.count and now - seen.last >= window:
+                    # the next one is sent in full again
+                    del self._seen[fp]
+
+            if lines:
+                self.buf.put_nowait(self._summary(f"Repeated in the last {window:g}s", lines))
+
+    def _suppress(self, record: LogRecord) -> None:
+        self.dropped += 1
+        key = (record.name, record.levelname, str(record.msg))
+        if key in self._suppressed or len(self._suppressed) < self.max_suppressed:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+
+    def _suppressed_embed(self, limit: int = 4096) -> Embed:
+        lines = [f"{count} x `{name} | {level}` {msg}" for (name, level, msg), count in self._suppressed.items()]
+        self._suppressed.clear()
+        return self._summary("Similar records suppressed", lines, limit)
+
+    @staticmethod
+    def _summary(title: str, lines: List[str], limit: int = 4096) -> Embed:
+        desc = "\n".join(lines)
+        limit = min(limit, 4096)
+        if len(desc) > limit:
+            desc = desc[:limit - 3] + "..."
+        return _Summary(title=title, description=desc, colour=Colour.dark_grey())
+
+    def _batch(self, first: Union[Embed, EmbedPayload]) -> List[Union[Embed, EmbedPayload]]:
+        batch = [first]
+        size = len(first)
+        while len(batch) < self.MAX_EMBEDS and not self.buf.empty():
+            emb = self.buf.get_nowait()
+            if size + len(emb) > self.MAX_CHARS:
+                self._carry = emb
+                break
+            batch.append(emb)
+            size += len(emb)
+        return batch
 
     def flush(self):
-        if self.buf.empty():
+        if get_ident() == self._thread and self._loop.is_running():
+            # Blocking here would block the sender too, it delivers on its own
+            return
+
+        if self._loop.is_running():
+            # Another thread, e.g logging.shutdown, waits for the sender to catch up,
+            # it keeps running for whatever is logged afterwards
+            try:
+                run_coroutine_threadsafe(self.join(), self._loop).result(self.DRAIN_TIMEOUT + 1)
+            except Exception:
+                pass
+            return
+
+        # The loop is gone, one blocking request for whatever is left
+        batch, records = self._drain_batch()
+        if not batch:
             return
-        adapter = self.webhook._adapter
-        self.webhook._adapter = self._sync_adapter
+        req = Request(self.url, data=json.dumps({"embeds": [i.to_dict() for i in batch]}).encode(),
+            headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            urlopen(req, timeout=self.DRAIN_TIMEOUT).close()
+            self.sent += records
+        except Exception:
+            self.dropped += records
 
+    def _drain_batch(self) -> Tuple[List[Union[Embed, EmbedPayload]], int]:
+        """Take everything still queued, as one message worth of embeds
+
+        Returns the embeds and the number of records they carry. Records
+        that don't fit are dropped and added to the suppressed summary.
+        """
+        pending = [*self._inflight, *([self._carry] if self._carry is not None else ())]
+        self._inflight, self._carry = [], None
         while not self.buf.empty():
-            emb = self.buf.get_nowait()
-            self.webhook.send(embed=emb)
+            pending.append(self.buf.get_nowait())
+        for seen in self._seen.values():
+            self._report_repeats(seen)
+
+        batch: List[Union[Embed, EmbedPayload]] = []
+        size = 0
+        # room is kept for the summary
+        for emb in pending:
+            if len(batch) == self.MAX_EMBEDS - 1 or size + len(emb) > self.MAX_CHARS - 1000:
+                continue
+            batch.append(emb)
+            size += len(emb)
+
+        records = sum(not isinstance(i, _Summary) for i in batch)
+        left = sum(not isinstance(i, _Summary) for i in pending) - records
+        if left:
+            self.dropped += left
+            self._suppressed[("neobot", "SHUTDOWN", "records left over at shutdown")] = left
+        if self._suppressed:
+            batch.append(self._suppressed_embed(self.MAX_CHARS - size - 100))
+        return batch, records
+
+    async def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the sender to send everything queued, records queued meanwhile included
 
-        self.webhook._adapter = adapter
+        Returns whether it did within ``timeout`` seconds, :attr:`DRAIN_TIMEOUT`
+        by default. Unlike :meth:`drain` the sender keeps running, what isn't sent
+        in time stays queued.
+        """
+        try:
+            await wait_for(self._caught_up(), timeout or self.DRAIN_TIMEOUT)
+        except TimeoutError:
+            return False
+        return not self.queued and not self._inflight
+
+    async def _caught_up(self) -> None:
+        # a stopped sender never catches up
+        while (self.queued or self._inflight) and not self._task.done():
+            await sleep(0.05)
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Stop the sender and send everything still queued in one message
+
+        Whatever can't be sent within ``timeout`` seconds, :attr:`DRAIN_TIMEOUT`
+        by default, is dropped. A batch that was cancelled mid send may be delivered twice.
+        """
+        if self._roller is not None:
+            self._roller.cancel()
+        self._task.cancel()
+        try:
+            await self._task
+        except CancelledError:
+            pass
+
+        batch, records = self._drain_batch()
+        if not batch:
+            return
+        try:
+            sent = await wait_for(self._send(batch), timeout or self.DRAIN_TIMEOUT)
+        except TimeoutError:
+            sent = False
+        if sent:
+            self.sent += records
+        else:
+            self.dropped += records
+
+    async def aclose(self, timeout: Optional[float] = None) -> None:
+        """Drain, see :meth:`drain`, then close the handler and its session"""
+        await self.drain(timeout)
+        super().close()
+        if self._own_session and self.session is not None:
+            await self.session.close()
 
     async def sender(self):
+        if self.session is None:
+            self.session = ClientSession()
+
         while True:
-            emb = await self.buf.get()
-            await self.webhook.send(embed=emb)
+            first, self._carry = self._carry or await self.buf.get(), None
+            batch = self._batch(first)
+            if self._suppressed and len(batch) < self.MAX_EMBEDS:
+                batch.append(self._suppressed_embed())
+            # the suppressed records were already counted as dropped
+            records = sum(not isinstance(i, _Summary) for i in batch)
+
+            self._inflight = batch
+            sent = await self._send(batch)
+            self._inflight = []
+            if sent:
+                self.sent += records
+            else:
+                self.dropped += records
+
+            if self._suppressed and self._carry is None and self.buf.empty():
+                # nothing left to ride along with
+                self._carry = self._suppressed_embed()
+
+    async def _send(self, batch: List[Union[Embed, EmbedPayload]]) -> bool:
+        payload = {"embeds": [i.to_dict() for i in batch]}
+        for attempt in range(self.MAX_RETRIES):
+            delay = self._blocked_until - monotonic()
+            if delay > 0:
+                await sleep(delay)
+
+            try:
+                async with self.session.post(self.url, json=payload) as resp: # type: ignore[union-attr]
+                    self._update_limits(resp.headers)
+                    if resp.status == 429:
+                        self.rate_limited += 1
+                        data: Dict[str, Any] = await resp.json(content_type=None) if resp.content_type == "application/json" else {}
+                        retry_after = float(data.get("retry_after", resp.headers.get("Retry-After", 1)))
+                        self._blocked_until = max(self._blocked_until, monotonic() + retry_after)
+                        continue
+                    if resp.status >= 500:
+                        await sleep(2 ** attempt)
+                        continue
+                    if resp.status >= 400:
+                        self._report(f"Webhook rejected {len(batch)} log embeds with {resp.status}: {await resp.text()}")
+                        return False
+                    return True
+            except (ClientError, TimeoutError):
+                await sleep(2 ** attempt)
+
+        self._report(f"Gave up sending {len(batch)} log embeds after {self.MAX_RETRIES} attempts")
+        return False
+
+    def _update_limits(self, headers) -> None:
+        # Wait out the bucket instead of running into a 429
+        if headers.get("X-RateLimit-Remaining") == "0":
+            reset_after = headers.get("X-RateLimit-Reset-After")
+            if reset_after is not None:
+                self._blocked_until = max(self._blocked_until, monotonic() + float(reset_after))
+
+    @staticmethod
+    def _report(msg: str) -> None:
+        # Not logged, that could feed the handler its own failures
+        print(f"WebHookHandler: {msg}", file=sys.stderr)
 
     def setFormatter(self, fmt: Formatter | None):
         if fmt is not None and not isinstance(fmt, EmbedFormatter):
             raise TypeError(f"Expected EmbedFormmatter instance got {type(fmt)} instance instead")
-        self.formatter = fmt
+        self.formatter = fmt or EmbedFormatter()
+
+    def format(self, record: LogRecord) -> EmbedPayload: # type: ignore[override]
+        # always an EmbedFormatter, see setFormatter
+        return self.formatter.format(record) # type: ignore[union-attr, return-value]
 
     def filter(self, record: LogRecord) -> bool:
         return super().filter(record) and wh_log
 
     def close(self):
         super().close()
-        self._task.cancel()
-        get_running_loop().create_task(self.session.close())
+        if self._loop.is_closed():
+            # logging.shutdown at exit, the loop is already gone
+            return
+        # aclose drains first, this only stops sending
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._roller is not None:
+            self._loop.call_soon_threadsafe(self._roller.cancel)
+        if self._own_session and self.session is not None:
+            run_coroutine_threadsafe(self.session.close(), self._loop)
 
 
 class EmbedFormatter(Formatter):
+    """Formats records into :class:`EmbedPayload` objects
+
+    ``embed`` is a template for every payload, its title,
+    description, colour and timestamp are replaced.
+    """
+    MAX_DESCRIPTION = 4096
+
     def __init__(self, fmt: Optional[str] = None, datefmt: Optional[str] = None, style: Literal['%', '$', '{'] = '%', validate: bool = True, embed: Embed = None) -> None:
         super().__init__(fmt=fmt, datefmt=datefmt, style=style, validate=validate)
         if embed is None:
             embed = Embed()
         self.emb = embed
+        # Fields every embed starts from, e.g a footer
+        self.template: Dict[str, Any] = {k: v for k, v in embed.to_dict().items() if k not in ("type", "title", "description")}
 
     colour_map = {
         'DEBUG': Colour.blue(),       # Blue
@@ -94,16 +617,25 @@ class EmbedFormatter(Formatter):
         'UNSET': Colour.blue()        # Blue
     }
 
-    def format(self, record: LogRecord) -> Embed:
-        self.emb.timestamp = datetime.fromtimestamp(record.created)
-        self.emb.colour = self.colour_map.get(record.levelname, Embed.Empty)
-        desc = super().format(record)
-        if len(desc) > 2048:
-            desc = '```\n' + desc[:2038] + "...```"
-        elif len(desc) < 2042:
-            desc = "```\n" + desc + "```"
-        else:
-            desc = "```\n" + desc[:len(desc) - 10] + "...```"
-        self.emb.description = desc
-        self.emb.title = "%(name)s | %(levelname)s" % record.__dict__
-        return Embed
+    def format(self, record: LogRecord) -> EmbedPayload: # type: ignore[override]
+        # Only the message is rendered here, its args may change after the
+        # logging call. The rest, tracebacks included, waits for the sender
+        colour = self.colour_map.get(record.levelname, None)
+        title = f"{record.name} | {record.levelname}"
+        return EmbedPayload(self, record, record.getMessage(), title[:256], None if colour is None else colour.value)
+
+    def render(self, payload: EmbedPayload) -> str:
+        """Render the description of ``payload``, what :meth:`logging.Formatter.format` would return"""
+        record = payload.record
+        record.message = payload.message
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        text = self.formatMessage(record)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        if record.stack_info:
+            text = f"{text}\n{self.formatStack(record.stack_info)}"
+        return code_block(text, self.MAX_DESCRIPTION)
@@ -1,7 +1,10 @@
 """A package for utilities which make my life easier!"""
 
 from .prefix_manager import PrefixManager
+from .guild_settings import GuildSettings, GuildConfig
+from .write_behind import WriteBehind
 from .db_client import PgClient
+from .db_sqlite import SqliteClient
 from .db_abc import DbClientABC
 from .emoji import emoji_map, get_emoji
 from .context import *
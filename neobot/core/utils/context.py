@@ -1,7 +1,8 @@
 from __future__ import annotations
 from re import L
 
-from typing import List, Type, Union
+from time import perf_counter
+from typing import Any, Dict, List, Type, Union
 
 from discord import AllowedMentions, File, Colour, Message
 from discord.abc import User, Messageable
@@ -160,6 +161,21 @@ class NeoEmbed(Embed):
 
 class EmbedContext(Context):
     """A subclass with embeding utils"""
+    def __init__(self, **attrs) -> None:
+        super().__init__(**attrs)
+        # command latencies are measured from when the message was picked up
+        self.started = perf_counter()
+
+    def log_fields(self) -> Dict[str, Any]:
+        """Fields describing this invocation for structured logs, see :class:`JsonLinesHandler`"""
+        return {
+            "guild": self.guild.id if self.guild else None,
+            "channel": self.channel.id,
+            "user": self.author.id,
+            "command": self.command.qualified_name if self.command else None,
+            "latency_ms": round((perf_counter() - self.started) * 1e3, 3)
+        }
+
     @property
     def neo_embed(self) -> Type[NeoEmbed]:
         return NeoEmbed
@@ -1,38 +1,100 @@
 from abc import abstractmethod, ABCMeta
-from typing import Dict, List, Optional
+from typing import Any, Callable, ClassVar, Dict, List, Optional
 
-from discord import Guild
+from discord import Guild, Object
 
 ## As 0f 2020 I only use the DB for prefixes
 # If i expand upon the DB then I shall add more methods
 #                    - Note To Self
+# Guild settings joined them, see get_settings and GuildSettings
 
 # GOAL: [Make it easier to migrate to different DB
 #        By Abstracting the DB specfic code]
 
-def db_client(db_type: Optional[str] = None):
+def db_client(db_type: Optional[str] = None, version: int = 1):
+    """Stamp a client with its Db type and the schema version it expects"""
     def inner(cls):
-        cls.__db_ver__ = 1
+        cls.__db_ver__ = version
         cls.__db_type__ = db_type
         return cls
     return inner
 
 @db_client(None)
 class DbClientABC(metaclass=ABCMeta):
+    # Stamped by db_client, declared for type checkers
+    __db_ver__: ClassVar[int] = 0
+    __db_type__: ClassVar[Optional[str]] = None
+
+    async def init(self) -> None:
+        """Connect to the Db, called before the bot logs in"""
+        return None
+
+    async def close(self) -> None:
+        """Disconnect from the Db, called when the bot closes"""
+        return None
+
     @abstractmethod
     async def load(self) -> Dict[int, List[str]]:
         raise NotImplementedError
 
     @abstractmethod
     async def get_prefix(self, guild: Guild) -> Optional[List[str]]:
-        """Gets the prefix associated with a Guild"""
+        """Gets the prefix associated with a Guild, None if it has none
+
+        Db errors must be raised rather than reported as None.
+        """
         raise NotImplementedError
 
+    async def get_prefixes(self, gids: List[int]) -> Dict[int, List[str]]:
+        """Gets the prefixes of many guilds at once, guilds without any are left out
+
+        This falls back to one get_prefix per guild,
+        clients should override it with a batched query.
+        """
+        res = {}
+        for gid in gids:
+            prefix = await self.get_prefix(Object(gid)) # type: ignore[arg-type]
+            if prefix:
+                res[gid] = prefix
+        return res
+
     @abstractmethod
     async def set_prefix(self, guild: Guild, prefixes: List[str]) -> None:
         """Sets the prefix for a Guild Object"""
         raise NotImplementedError
 
+    async def set_prefixes(self, prefixes: Dict[int, List[str]]) -> None:
+        """Sets the prefixes of many guilds at once, keyed by guild id
+
+        This falls back to one set_prefix per guild,
+        clients should override it with a batched statement.
+        """
+        for gid, prefix in prefixes.items():
+            await self.set_prefix(Object(gid), prefix) # type: ignore[arg-type]
+
+    async def listen_prefixes(self, callback: Callable[[Optional[int], Optional[List[str]]], None]) -> bool:
+        """Call ``callback`` with a guild id and its new prefixes whenever another client changes them
+
+        The prefixes are None when the guild should be reloaded, the guild id is
+        None when any guild may be stale. Returns whether the client supports it.
+        """
+        return False
+
+    async def unlisten_prefixes(self) -> None:
+        """Stop calling the callback given to listen_prefixes"""
+        return None
+
+    async def get_settings(self, gid: int) -> Optional[Dict[str, Any]]:
+        """Gets the settings of a guild as given to set_settings, None if it has none"""
+        return None
+
+    async def set_settings(self, settings: Dict[int, Dict[str, Any]]) -> None:
+        """Sets the settings of many guilds at once, keyed by guild id
+
+        Empty settings are the defaults, clients may drop their rows.
+        """
+        raise NotImplementedError(f"{type(self).__name__} can't store guild settings")
+
     @abstractmethod
     async def append_prefix(self, guild: Guild, prefix: str) -> None:
         """Appends the prefix"""
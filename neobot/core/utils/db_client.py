@@ -1,54 +1,358 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional, TYPE_CHECKING
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TYPE_CHECKING
+from uuid import uuid4
+
 import asyncpg
 
+from ..leven.stats import Histogram
 from .db_abc import db_client, DbClientABC
 
 if TYPE_CHECKING:
+    from asyncpg.prepared_stmt import PreparedStatement
     from discord.guild import Guild
 
 __all__ = (
+    "PREFIX_CHANNEL",
+    "PgConnection",
     "PgClient",
 )
 
-@db_client("Postgre")
+logger = logging.getLogger(__name__)
+
+# NOTIFY channel carrying prefix changes between processes
+PREFIX_CHANNEL = "neobot_prefix"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_PAYLOAD = 7999
+# Held while migrating so processes starting together don't race
+MIGRATION_LOCK = 0x6E656F626F74
+
+# MIGRATIONS[i] moves the schema from version i to i + 1
+MIGRATIONS = (
+    (
+        "CREATE TABLE IF NOT EXISTS prefix (gid BIGINT NOT NULL CHECK (gid >= 0), prefix TEXT ARRAY)",
+    ),
+    (
+        # UPDATE never created rows, so duplicates are unlikely. Nothing records
+        # their age, ctid only orders them by where they are stored, so one is
+        # kept arbitrarily: the one with the highest ctid
+        "DELETE FROM prefix a USING prefix b WHERE a.gid = b.gid AND a.ctid < b.ctid",
+        "ALTER TABLE prefix ADD PRIMARY KEY (gid)",
+    ),
+    (
+        # only guilds with non default settings get a row
+        "CREATE TABLE IF NOT EXISTS guild_settings (gid BIGINT PRIMARY KEY CHECK (gid >= 0), settings JSONB NOT NULL)",
+    ),
+)
+
+class PgConnection(asyncpg.Connection):
+    """A connection keeping the statements PgClient runs prepared"""
+    __slots__ = ("statements",)
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.statements: Dict[str, PreparedStatement] = {}
+
+    async def prepared(self, query: str) -> PreparedStatement:
+        """Return ``query`` prepared on this connection, preparing it on first use"""
+        stmt = self.statements.get(query, None)
+        if stmt is None:
+            stmt = self.statements[query] = await self.prepare(query)
+        return stmt
+
+@db_client("Postgre", version=len(MIGRATIONS))
 class PgClient(DbClientABC):
-    def __init__(self, dns) -> None:
-        self.pool: asyncpg.pool.Pool = asyncpg.create_pool(dns)
+    """A postgres client using an asyncpg pool
+
+    :meth:`init` must be awaited before use, :class:`NeoBase` does it on start.
+    It also migrates the schema to ``__db_ver__``.
+
+    Parameters
+    ----------
+    dns : str
+        The postgres connection url
+    min_size : int
+        Connections the pool keeps open, by default 2
+    max_size : int
+        Connections the pool opens at most, by default 10
+    statement_cache_size : int
+        Statements asyncpg keeps prepared per connection for ad hoc queries, by default 256
+    command_timeout : Optional[float]
+        Seconds a query may take, by default 10
+    acquire_timeout : Optional[float]
+        Seconds to wait for a free connection, by default 10
+    max_inactive_connection_lifetime : float
+        Seconds before idle connections above ``min_size`` are closed, by default 300
+    """
+    def __init__(self, dns, *, min_size: int = 2, max_size: int = 10, statement_cache_size: int = 256, command_timeout: Optional[float] = 10.0, acquire_timeout: Optional[float] = 10.0, max_inactive_connection_lifetime: float = 300.0) -> None:
+        self.dns = dns
+        self.pool: Optional[asyncpg.pool.Pool] = None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.command_timeout = command_timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_inactive_connection_lifetime = max_inactive_connection_lifetime
+        # microseconds spent waiting on the pool for a connection
+        self.acquire_wait = Histogram()
+        self._waiting = 0
         self.append = (
-            "UPDATE prefix "
-            "SET prefix = prefix || $1 "
-            "WHERE gid = $2"
+            "INSERT INTO prefix (gid, prefix) VALUES ($2, ARRAY[$1::TEXT]) "
+            "ON CONFLICT (gid) DO UPDATE SET prefix = prefix.prefix || $1::TEXT "
+            "RETURNING prefix"
             )
+        self.notify = "SELECT pg_notify($1, $2)"
         self.get = "SELECT prefix FROM prefix WHERE gid = $1"
-        self.set = "UPDATE prefix SET prefix = $1 WHERE gid = $2"
-        self.create_table = \
-            "CREATE TABLE IF NOT EXIST prefix (gid BIGINT NOT NULL CHECK (gid >= 0), prefix TEXT ARRAY)"
+        self.get_many = "SELECT gid, prefix FROM prefix WHERE gid = ANY($1::BIGINT[])"
+        self.get_all = "SELECT gid, prefix FROM prefix"
+        self.set = (
+            "INSERT INTO prefix (gid, prefix) VALUES ($2, $1) "
+            "ON CONFLICT (gid) DO UPDATE SET prefix = EXCLUDED.prefix"
+            )
+        self.get_settings_query = "SELECT settings::TEXT FROM guild_settings WHERE gid = $1"
+        self.set_settings_query = (
+            "INSERT INTO guild_settings (gid, settings) VALUES ($1, $2::JSONB) "
+            "ON CONFLICT (gid) DO UPDATE SET settings = EXCLUDED.settings"
+            )
+        self.del_settings_query = "DELETE FROM guild_settings WHERE gid = ANY($1::BIGINT[])"
+        # Tells our own notifications apart from other processes'
+        self.origin = uuid4().hex
+        self._on_prefix: Optional[Callable[[Optional[int], Optional[List[str]]], None]] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._relisten: Optional[asyncio.Task] = None
+
+    ## Lifecycle ##
+    async def init(self) -> None:
+        if self.pool is not None:
+            return
+
+        self.pool = await asyncpg.create_pool(
+            self.dns,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            max_inactive_connection_lifetime=self.max_inactive_connection_lifetime,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.command_timeout,
+            connection_class=PgConnection
+        )
+        try:
+            await self.migrate()
+        except BaseException:
+            # a failed init leaves nothing behind, so it can be retried
+            pool, self.pool = self.pool, None
+            await pool.close()
+            raise
+
+    async def close(self) -> None:
+        await self.unlisten_prefixes()
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            await pool.close()
+
+    def _get_pool(self) -> asyncpg.pool.Pool:
+        if self.pool is None:
+            raise RuntimeError("PgClient.init() must be awaited before using the client")
+        return self.pool
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[PgConnection]:
+        """Acquire a connection from the pool, timing how long that took"""
+        pool = self._get_pool()
+        start = perf_counter()
+        self._waiting += 1
+        try:
+            con = await pool.acquire(timeout=self.acquire_timeout)
+        finally:
+            self._waiting -= 1
+        self.acquire_wait.record((perf_counter() - start) * 1e6)
 
-    async def get_prefix(self, guild: Guild) -> Optional[List[str]]:
         try:
-            return (await self.pool.fetchrow(self.get, guild.id))["prefix"] # type: ignore[index]
-        except Exception:
-            return None
+            yield con
+        finally:
+            await pool.release(con)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Return the pool size, its acquired and idle connections, and acquire wait times in microseconds"""
+        size = idle = 0
+        if self.pool is not None:
+            size = self.pool.get_size()
+            idle = self.pool.get_idle_size()
+
+        return {
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size": size,
+            "acquired": size - idle,
+            "idle": idle,
+            "waiting": self._waiting,
+            "wait": self.acquire_wait.to_dict()
+        }
+
+    ## Prefixes ##
+    async def get_prefix(self, guild: Guild) -> Optional[List[str]]:
+        # errors propagate, None means the guild has no prefixes
+        async with self.acquire() as con:
+            return await (await con.prepared(self.get)).fetchval(guild.id)
+
+    async def get_prefixes(self, gids: List[int]) -> Dict[int, List[str]]:
+        async with self.acquire() as con:
+            return {i["gid"]: i["prefix"] for i in await (await con.prepared(self.get_many)).fetch(gids)}
 
     async def load(self) -> Dict[int, List[str]]:
-        async with self.pool.acquire() as con:
-            return {
-                    i[0]: i[1] async for i in con.cursor(f"SELECT * FROM prefix")
-                }
+        async with self.acquire() as con:
+            # cursors only exist within a transaction
+            async with con.transaction():
+                return {
+                        i[0]: i[1] async for i in (await con.prepared(self.get_all)).cursor()
+                    }
 
     async def set_prefix(self, guild: Guild, prefixes: List[str]):
-        async with self.pool.acquire() as con:
+        async with self.acquire() as con:
+            async with con.transaction():
+                await (await con.prepared(self.set)).fetchval(prefixes, guild.id)
+                # only delivered once the transaction commits
+                await (await con.prepared(self.notify)).fetchval(PREFIX_CHANNEL, self._payload(guild.id, prefixes))
+
+    async def set_prefixes(self, prefixes: Dict[int, List[str]]) -> None:
+        async with self.acquire() as con:
             async with con.transaction():
-                await con.execute(self.set, prefixes, guild.id)
+                await con.executemany(self.set, [(prefix, gid) for gid, prefix in prefixes.items()])
+                await con.executemany(self.notify, [(PREFIX_CHANNEL, self._payload(gid, prefix)) for gid, prefix in prefixes.items()])
 
     async def append_prefix(self, guild: Guild, prefix: str):
-        async with self.pool.acquire() as con:
+        async with self.acquire() as con:
+            async with con.transaction():
+                prefixes = await (await con.prepared(self.append)).fetchval(prefix, guild.id)
+                if prefixes is not None:
+                    await (await con.prepared(self.notify)).fetchval(PREFIX_CHANNEL, self._payload(guild.id, prefixes))
+
+    ## Settings ##
+    async def get_settings(self, gid: int) -> Optional[Dict[str, Any]]:
+        async with self.acquire() as con:
+            settings = await (await con.prepared(self.get_settings_query)).fetchval(gid)
+        return None if settings is None else json.loads(settings)
+
+    async def set_settings(self, settings: Dict[int, Dict[str, Any]]) -> None:
+        # default settings don't need a row
+        rows = [(gid, json.dumps(data)) for gid, data in settings.items() if data]
+        cleared = [gid for gid, data in settings.items() if not data]
+        async with self.acquire() as con:
             async with con.transaction():
-                await con.execute(self.append, prefix, guild.id)
+                if rows:
+                    await con.executemany(self.set_settings_query, rows)
+                if cleared:
+                    await (await con.prepared(self.del_settings_query)).fetchval(cleared)
+
+    ## Notifications ##
+    def _payload(self, gid: int, prefixes: Optional[List[str]]) -> str:
+        payload = json.dumps({"gid": gid, "prefixes": prefixes, "origin": self.origin})
+        if len(payload.encode()) > MAX_PAYLOAD:
+            # too big, listeners reload the guild instead
+            payload = json.dumps({"gid": gid, "prefixes": None, "origin": self.origin})
+        return payload
+
+    async def listen_prefixes(self, callback: Callable[[Optional[int], Optional[List[str]]], None]) -> bool:
+        self._on_prefix = callback
+        await self._listen()
+        return True
+
+    async def unlisten_prefixes(self) -> None:
+        self._on_prefix = None
+        if self._relisten is not None:
+            self._relisten.cancel()
+            self._relisten = None
+
+        con, self._listener = self._listener, None
+        if con is not None:
+            con.remove_termination_listener(self._on_listener_lost)
+            await con.remove_listener(PREFIX_CHANNEL, self._on_notify)
+            await self._get_pool().release(con)
+
+    async def _listen(self) -> None:
+        # LISTEN is per connection, so this one is held for as long as we listen
+        pool = self._get_pool()
+        con = await pool.acquire(timeout=self.acquire_timeout)
+        try:
+            await con.add_listener(PREFIX_CHANNEL, self._on_notify)
+        except BaseException:
+            await pool.release(con)
+            raise
+        con.add_termination_listener(self._on_listener_lost)
+        self._listener = con
+
+    def _on_notify(self, con: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        if self._on_prefix is None:
+            return
+
+        try:
+            data = json.loads(payload)
+            gid = int(data["gid"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed prefix notification %r", payload)
+            return
+
+        if data.get("origin") != self.origin:
+            self._on_prefix(gid, data.get("prefixes", None))
+
+    def _on_listener_lost(self, con: asyncpg.Connection) -> None:
+        self._listener = None
+        if self._on_prefix is None:
+            return
+
+        logger.warning("Lost the prefix notification connection, reconnecting")
+        # changes made in the meantime are never delivered
+        self._on_prefix(None, None)
+        self._relisten = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = 1
+        while self._on_prefix is not None:
+            try:
+                await self._listen()
+            except Exception:
+                logger.exception("Failed to listen for prefix changes, retrying in %ds", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+            else:
+                # anything changed before LISTEN took effect was missed too
+                self._on_prefix(None, None)
+                break
+        self._relisten = None
 
     async def create_prefix_table(self):
-        async with self.pool.acquire() as con:
+        await self.migrate()
+
+    ## Schema ##
+    async def migrate(self) -> int:
+        """Bring the schema up to ``__db_ver__``, returns the version it was at"""
+        async with self.acquire() as con:
             async with con.transaction():
-                await con.execute(self.table)
+                await con.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK)
+                await con.execute("CREATE TABLE IF NOT EXISTS neobot_schema (version INT NOT NULL)")
+                version = await con.fetchval("SELECT version FROM neobot_schema")
+                if version is None:
+                    # Tables from before versioning are brought up by
+                    # the first migration being idempotent
+                    version = 0
+                    await con.execute("INSERT INTO neobot_schema (version) VALUES (0)")
+
+                if version > self.__db_ver__:
+                    raise RuntimeError(f"The database schema is at version {version}, newer than the supported {self.__db_ver__}")
+
+                for target in range(version, self.__db_ver__):
+                    logger.info("Migrating the database schema to version %d", target + 1)
+                    for statement in MIGRATIONS[target]:
+                        await con.execute(statement)
+
+                if version != self.__db_ver__:
+                    await con.execute("UPDATE neobot_schema SET version = $1", self.__db_ver__)
+
+        if version != self.__db_ver__:
+            # statements prepared against the old schema are invalid now
+            await self._get_pool().expire_connections()
+        return version
@@ -0,0 +1,290 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from .db_abc import db_client, DbClientABC
+
+if TYPE_CHECKING:
+    from discord.guild import Guild
+
+__all__ = (
+    "SqliteClient",
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# MIGRATIONS[i] moves the schema from version i to i + 1, tracked in PRAGMA user_version
+MIGRATIONS = (
+    (
+        # prefixes are stored as a json array
+        "CREATE TABLE IF NOT EXISTS prefix (gid INTEGER PRIMARY KEY CHECK (gid >= 0), prefix TEXT NOT NULL)",
+    ),
+    (
+        # settings are a json object, only guilds with non default settings get a row
+        "CREATE TABLE IF NOT EXISTS guild_settings (gid INTEGER PRIMARY KEY CHECK (gid >= 0), settings TEXT NOT NULL)",
+    ),
+)
+
+# Older sqlite builds allow at most 999 bound parameters
+MAX_PARAMS = 900
+
+@db_client("SQLite", version=len(MIGRATIONS))
+class SqliteClient(DbClientABC):
+    """A client storing prefixes and guild settings in an embedded sqlite database
+
+    All sqlite calls run on one dedicated thread, so the event loop never
+    blocks on disk. Writes are queued and committed together in a single
+    transaction, each write resolves once its transaction commits. Every
+    write gets its own savepoint, a failing write is rolled back and raised
+    to its caller alone while the rest of the batch still commits.
+
+    Parameters
+    ----------
+    path : str
+        The database file, created if missing
+    batch_delay : float
+        Seconds writes are collected for before they are committed, by default 0.05
+    mmap_size : int
+        Bytes of the database file sqlite may memory map for reads, by default 256 MiB
+    busy_timeout : int
+        Milliseconds to wait on a database locked by another process, by default 5000
+    """
+    def __init__(self, path: str, *, batch_delay: float = 0.05, mmap_size: int = 256 * 1024 * 1024, busy_timeout: int = 5000) -> None:
+        self.path = path
+        self.batch_delay = batch_delay
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self._con: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # (operation, arguments, future) waiting for the next commit
+        self._writes: List[Tuple[Callable[..., Any], Tuple[Any, ...], asyncio.Future]] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+    ## Lifecycle ##
+    async def init(self) -> None:
+        if self._executor is not None:
+            return
+
+        # sqlite connections stay on the thread that made them
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="neobot-sqlite")
+        try:
+            await self._run(self._connect)
+            await self.migrate()
+        except BaseException:
+            # a failed init leaves nothing behind, so it can be retried
+            await self._run(self._disconnect)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            raise
+
+    async def close(self) -> None:
+        if self._executor is None:
+            return
+
+        if self._flusher is not None:
+            # a batch it already handed to the sqlite thread still commits
+            self._flusher.cancel()
+            self._flusher = None
+        await self._flush()
+
+        await self._run(self._disconnect)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def _connect(self) -> None:
+        # autocommit, transactions are opened explicitly
+        con = sqlite3.connect(self.path, isolation_level=None)
+        con.execute("PRAGMA journal_mode = WAL")
+        # WAL stays consistent with NORMAL, only the last commits may be lost on power loss
+        con.execute("PRAGMA synchronous = NORMAL")
+        con.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        con.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        self._con = con
+
+    def _disconnect(self) -> None:
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        if self._executor is None:
+            raise RuntimeError("SqliteClient.init() must be awaited before using the client")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(func, *args))
+
+    ## Schema ##
+    async def migrate(self) -> int:
+        """Bring the schema up to ``__db_ver__``, returns the version it was at"""
+        return await self._run(self._migrate)
+
+    def _migrate(self) -> int:
+        con = self._con
+        assert con is not None
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            version = con.execute("PRAGMA user_version").fetchone()[0]
+            if version > self.__db_ver__:
+                raise RuntimeError(f"The database schema is at version {version}, newer than the supported {self.__db_ver__}")
+
+            for target in range(version, self.__db_ver__):
+                logger.info("Migrating the database schema to version %d", target + 1)
+                for statement in MIGRATIONS[target]:
+                    con.execute(statement)
+
+            con.execute(f"PRAGMA user_version = {int(self.__db_ver__)}")
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return version
+
+    async def create_prefix_table(self) -> None:
+        await self.migrate()
+
+    ## Reads ##
+    async def get_prefix(self, guild: Guild) -> Optional[List[str]]:
+        return await self._run(self._get_prefix, guild.id)
+
+    def _get_prefix(self, gid: int) -> Optional[List[str]]:
+        row = self._con.execute("SELECT prefix FROM prefix WHERE gid = ?", (gid,)).fetchone() # type: ignore[union-attr]
+        return None if row is None else json.loads(row[0])
+
+    async def get_prefixes(self, gids: List[int]) -> Dict[int, List[str]]:
+        return await self._run(self._get_prefixes, list(gids))
+
+    def _get_prefixes(self, gids: List[int]) -> Dict[int, List[str]]:
+        res = {}
+        for i in range(0, len(gids), MAX_PARAMS):
+            chunk = gids[i:i + MAX_PARAMS]
+            query = f"SELECT gid, prefix FROM prefix WHERE gid IN ({', '.join('?' * len(chunk))})"
+            for gid, prefix in self._con.execute(query, chunk): # type: ignore[union-attr]
+                res[gid] = json.loads(prefix)
+        return res
+
+    async def load(self) -> Dict[int, List[str]]:
+        # One hop to the sqlite thread for the whole table,
+        # the file is read through mmap rather than read calls
+        return await self._run(self._load)
+
+    def _load(self) -> Dict[int, List[str]]:
+        loads = json.loads
+        return {gid: loads(prefix) for gid, prefix in self._con.execute("SELECT gid, prefix FROM prefix")} # type: ignore[union-attr]
+
+    async def get_settings(self, gid: int) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get_settings, gid)
+
+    def _get_settings(self, gid: int) -> Optional[Dict[str, Any]]:
+        row = self._con.execute("SELECT settings FROM guild_settings WHERE gid = ?", (gid,)).fetchone() # type: ignore[union-attr]
+        return None if row is None else json.loads(row[0])
+
+    ## Writes ##
+    async def set_prefix(self, guild: Guild, prefixes: List[str]) -> None:
+        await self._write(self._set, guild.id, list(prefixes))
+
+    async def set_prefixes(self, prefixes: Dict[int, List[str]]) -> None:
+        await self._write(self._set_many, [(gid, json.dumps(prefix)) for gid, prefix in prefixes.items()])
+
+    async def append_prefix(self, guild: Guild, prefix: str) -> None:
+        await self._write(self._append, guild.id, prefix)
+
+    async def set_settings(self, settings: Dict[int, Dict[str, Any]]) -> None:
+        await self._write(self._set_settings, [(gid, json.dumps(data) if data else None) for gid, data in settings.items()])
+
+    def _set(self, con: sqlite3.Connection, gid: int, prefixes: List[str]) -> None:
+        con.execute("INSERT OR REPLACE INTO prefix (gid, prefix) VALUES (?, ?)", (gid, json.dumps(prefixes)))
+
+    def _set_many(self, con: sqlite3.Connection, rows: List[Tuple[int, str]]) -> None:
+        con.executemany("INSERT OR REPLACE INTO prefix (gid, prefix) VALUES (?, ?)", rows)
+
+    def _append(self, con: sqlite3.Connection, gid: int, prefix: str) -> List[str]:
+        row = con.execute("SELECT prefix FROM prefix WHERE gid = ?", (gid,)).fetchone()
+        prefixes = [] if row is None else json.loads(row[0])
+        prefixes.append(prefix)
+        self._set(con, gid, prefixes)
+        return prefixes
+
+    def _set_settings(self, con: sqlite3.Connection, rows: List[Tuple[int, Optional[str]]]) -> None:
+        # default settings don't need a row
+        con.executemany("INSERT OR REPLACE INTO guild_settings (gid, settings) VALUES (?, ?)", [i for i in rows if i[1] is not None])
+        con.executemany("DELETE FROM guild_settings WHERE gid = ?", [(i[0],) for i in rows if i[1] is None])
+
+    def _write(self, op: Callable[..., Any], *args) -> asyncio.Future:
+        if self._executor is None:
+            raise RuntimeError("SqliteClient.init() must be awaited before using the client")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._writes.append((op, args, fut))
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+        return fut
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.batch_delay)
+        self._flusher = None
+        await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._writes:
+            return
+
+        batch, self._writes = self._writes, []
+        job = asyncio.ensure_future(self._run(self._commit, [(op, args) for op, args, _ in batch]))
+        # resolved from a callback, so the writers hear back even if we get cancelled
+        job.add_done_callback(partial(self._resolve, batch))
+        # failures are reported to the writers
+        with suppress(Exception):
+            await asyncio.shield(job)
+
+    @staticmethod
+    def _resolve(batch: List[Tuple[Callable[..., Any], Tuple[Any, ...], asyncio.Future]], job: asyncio.Future) -> None:
+        if job.cancelled():
+            exc: Optional[BaseException] = asyncio.CancelledError()
+        else:
+            exc = job.exception()
+
+        if exc is not None:
+            for *_, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+
+        for (*_, fut), (ok, res) in zip(batch, job.result()):
+            if fut.done():
+                continue
+            if ok:
+                fut.set_result(res)
+            else:
+                fut.set_exception(res)
+
+    def _commit(self, batch: List[Tuple[Callable[..., Any], Tuple[Any, ...]]]) -> List[Tuple[bool, Any]]:
+        """Run a batch in one transaction, returns ``(succeeded, result or exception)`` per write"""
+        con = self._con
+        assert con is not None
+        results: List[Tuple[bool, Any]] = []
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            for op, args in batch:
+                # a failing write only undoes itself
+                con.execute("SAVEPOINT write")
+                try:
+                    res = op(con, *args)
+                except Exception as e:
+                    con.execute("ROLLBACK TO write")
+                    con.execute("RELEASE write")
+                    results.append((False, e))
+                else:
+                    con.execute("RELEASE write")
+                    results.append((True, res))
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return results
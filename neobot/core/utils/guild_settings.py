@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from sys import intern
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from discord.ext.commands import BucketType, CooldownMapping
+from discord.ext.commands.errors import CommandOnCooldown, DisabledCommand
+
+from .write_behind import WriteBehind
+
+if TYPE_CHECKING:
+    from discord import Client, Guild
+    from discord.ext.commands import Context
+
+    from .db_abc import DbClientABC
+
+__all__ = (
+    "GuildConfig",
+    "DEFAULT_CONFIG",
+    "GuildSettings"
+)
+
+logger = logging.getLogger(__name__)
+
+_NO_COMMANDS: FrozenSet[str] = frozenset()
+
+class GuildConfig:
+    """The settings of a guild
+
+    Records are never modified, :meth:`replace` makes a new one.
+    That lets every guild on the defaults share :data:`DEFAULT_CONFIG`
+    and guilds with the same disabled commands share one frozenset.
+
+    Attributes
+    ----------
+    disabled : FrozenSet[str]
+        Qualified names of the commands disabled in the guild,
+        disabling a group disables its sub commands too
+    typo_suggest : bool
+        Whether command typos are answered with suggestions
+    cooldowns : Tuple[Tuple[str, int, float], ...]
+        ``(qualified name, rate, per)`` cooldowns applied on top of the commands' own
+    """
+    __slots__ = ("disabled", "typo_suggest", "cooldowns")
+
+    def __init__(self, disabled: FrozenSet[str] = _NO_COMMANDS, typo_suggest: bool = True, cooldowns: Tuple[Tuple[str, int, float], ...] = ()) -> None:
+        self.disabled = disabled
+        self.typo_suggest = typo_suggest
+        self.cooldowns = cooldowns
+
+    def __repr__(self) -> str:
+        return f"<GuildConfig disabled={len(self.disabled)} typo_suggest={self.typo_suggest} cooldowns={len(self.cooldowns)}>"
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, GuildConfig) and other.disabled == self.disabled
+            and other.typo_suggest == self.typo_suggest and other.cooldowns == self.cooldowns)
+
+    def __hash__(self) -> int:
+        return hash((self.disabled, self.typo_suggest, self.cooldowns))
+
+    def replace(self, **changes: Any) -> GuildConfig:
+        return GuildConfig(
+            changes.get("disabled", self.disabled),
+            changes.get("typo_suggest", self.typo_suggest),
+            changes.get("cooldowns", self.cooldowns)
+        )
+
+    def is_default(self) -> bool:
+        return not self.disabled and self.typo_suggest and not self.cooldowns
+
+    def cooldown(self, name: str) -> Optional[Tuple[int, float]]:
+        for cmd, rate, per in self.cooldowns:
+            if cmd == name:
+                return rate, per
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the settings that differ from the defaults, for storage"""
+        data: Dict[str, Any] = {}
+        if self.disabled:
+            data["disabled"] = sorted(self.disabled)
+        if not self.typo_suggest:
+            data["typo_suggest"] = False
+        if self.cooldowns:
+            data["cooldowns"] = [list(i) for i in self.cooldowns]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> GuildConfig:
+        return cls(
+            frozenset(map(intern, data.get("disabled", ()))),
+            bool(data.get("typo_suggest", True)),
+            tuple((intern(name), int(rate), float(per)) for name, rate, per in data.get("cooldowns", ()))
+        )
+
+DEFAULT_CONFIG = GuildConfig()
+
+class GuildSettings:
+    """A manager for per guild settings, see :class:`GuildConfig`
+
+    Guilds are loaded lazily, on their first lookup. Only guilds with
+    settings of their own get a record, the rest all point at
+    :data:`DEFAULT_CONFIG`. Changes are buffered and written in batches
+    with ``write_behind``, see :class:`WriteBehind`.
+
+    Parameters
+    ----------
+    write_behind : Optional[float]
+        Buffer Db writes for up to this many seconds, straight to the Db if None
+    max_pending : int
+        Flush right away once this many guilds have buffered writes
+    """
+    def __init__(self, bot: Client, db_client: DbClientABC, *, write_behind: Optional[float] = 5.0, max_pending: int = 512) -> None:
+        self.bot = bot
+        self.db = db_client
+        # guild id: config, for every guild looked up so far
+        self._configs: Dict[int, GuildConfig] = {}
+        # Shared frozensets of disabled commands
+        self._interned: Dict[FrozenSet[str], FrozenSet[str]] = {_NO_COMMANDS: _NO_COMMANDS}
+        # Concurrent lookups of a guild share one load
+        self._lookups: Dict[int, asyncio.Task] = {}
+        # (guild id, command): (rate, per, cooldown mapping)
+        self._buckets: Dict[Tuple[int, str], Tuple[int, float, CooldownMapping]] = {}
+
+        self.write_behind = write_behind
+        # guild id: the latest config not yet written to the Db
+        self._pending: WriteBehind[int, GuildConfig] = WriteBehind(self._write, write_behind, max_pending=max_pending, what="guild settings")
+
+    def __getitem__(self, guild: Guild) -> GuildConfig:
+        return self.get_local(guild)
+
+    def __len__(self) -> int:
+        return len(self._configs)
+
+    def __repr__(self) -> str:
+        return f"<GuildSettings of {repr(self.bot)} guilds={len(self._configs)}>"
+
+    ## Getters ##
+    def get_local(self, guild: Optional[Guild]) -> GuildConfig:
+        """Return the loaded config of ``guild``, the defaults if it isn't loaded"""
+        if not guild:
+            return DEFAULT_CONFIG
+        return self._configs.get(guild.id, DEFAULT_CONFIG)
+
+    async def get(self, guild: Optional[Guild]) -> GuildConfig:
+        if not guild:
+            return DEFAULT_CONFIG
+        config = self._configs.get(guild.id, None)
+        if config is not None:
+            return config
+
+        lookup = self._lookups.get(guild.id, None)
+        if lookup is None:
+            lookup = self._lookups[guild.id] = asyncio.create_task(self._load(guild.id))
+            lookup.add_done_callback(lambda _: self._lookups.pop(guild.id, None))
+        return await asyncio.shield(lookup)
+
+    async def _load(self, gid: int) -> GuildConfig:
+        try:
+            data = await self.db.get_settings(gid)
+        except Exception:
+            # not cached, the next lookup tries again
+            logger.exception("Failed to load the settings of guild %d", gid)
+            return DEFAULT_CONFIG
+
+        config = DEFAULT_CONFIG
+        if data:
+            config = GuildConfig.from_dict(data)
+            config = config.replace(disabled=self._intern(config.disabled))
+            if config.is_default():
+                config = DEFAULT_CONFIG
+        # changes made during the load are newer
+        return self._configs.setdefault(gid, config)
+
+    def _intern(self, names: Iterable[str]) -> FrozenSet[str]:
+        names = frozenset(names)
+        return self._interned.setdefault(names, names)
+
+    ## Setters ##
+    async def update(self, guild: Guild, **changes: Any) -> GuildConfig:
+        """Replace the given :class:`GuildConfig` attributes of ``guild``"""
+        # loaded first, the other settings must survive
+        config = await self.get(guild)
+        changes["disabled"] = self._intern(changes.get("disabled", config.disabled))
+        config = config.replace(**changes)
+        if config.is_default():
+            config = DEFAULT_CONFIG
+
+        self._configs[guild.id] = config
+        self._buckets = {k: v for k, v in self._buckets.items() if k[0] != guild.id}
+        if self.write_behind is not None:
+            self._buffer(guild.id, config)
+        else:
+            await self.db.set_settings({guild.id: config.to_dict()})
+        return config
+
+    async def disable(self, guild: Guild, name: str) -> GuildConfig:
+        config = await self.get(guild)
+        return await self.update(guild, disabled=config.disabled | {intern(name)})
+
+    async def enable(self, guild: Guild, name: str) -> GuildConfig:
+        config = await self.get(guild)
+        return await self.update(guild, disabled=config.disabled - {name})
+
+    async def set_typo_suggest(self, guild: Guild, enabled: bool) -> GuildConfig:
+        return await self.update(guild, typo_suggest=enabled)
+
+    async def set_cooldown(self, guild: Guild, name: str, rate: Optional[int], per: float = 0.0) -> GuildConfig:
+        """Override the cooldown of a command in ``guild``, removes the override if ``rate`` is None"""
+        config = await self.get(guild)
+        cooldowns = tuple(i for i in config.cooldowns if i[0] != name)
+        if rate is not None:
+            cooldowns += ((intern(name), int(rate), float(per)),)
+        return await self.update(guild, cooldowns=cooldowns)
+
+    ## Checks ##
+    async def check(self, ctx: Context) -> bool:
+        """A global check enforcing disabled commands"""
+        if ctx.guild is None or ctx.command is None:
+            return True
+
+        config = self._configs.get(ctx.guild.id, None) or await self.get(ctx.guild)
+        if config is DEFAULT_CONFIG:
+            return True
+
+        cmd = ctx.command
+        while cmd is not None:
+            if cmd.qualified_name in config.disabled:
+                raise DisabledCommand(f"{cmd.qualified_name} is disabled in this server")
+            cmd = cmd.parent
+        return True
+
+    async def apply_cooldown(self, ctx: Context) -> None:
+        """A before invoke hook enforcing cooldown overrides
+
+        Checks also run when the help command lists commands,
+        so the cooldown is only spent once a command is really invoked.
+        """
+        if ctx.guild is None or ctx.command is None:
+            return
+
+        override = self.get_local(ctx.guild).cooldown(ctx.command.qualified_name)
+        if override is not None:
+            bucket = self._cooldown(ctx.guild.id, ctx.command.qualified_name, *override).get_bucket(ctx.message)
+            retry_after = bucket.update_rate_limit()
+            if retry_after:
+                raise CommandOnCooldown(bucket, retry_after)
+
+    def _cooldown(self, gid: int, name: str, rate: int, per: float) -> CooldownMapping:
+        entry = self._buckets.get((gid, name), None)
+        if entry is None or entry[:2] != (rate, per):
+            entry = self._buckets[(gid, name)] = (rate, per, CooldownMapping.from_cooldown(rate, per, BucketType.user))
+        return entry[2]
+
+    ## Write behind ##
+    def _buffer(self, gid: int, config: GuildConfig) -> None:
+        self._pending.put(gid, config)
+
+    async def _write(self, batch: Dict[int, GuildConfig]) -> None:
+        await self.db.set_settings({gid: config.to_dict() for gid, config in batch.items()})
+
+    async def flush(self) -> None:
+        """Write all buffered settings to the Db in one batch"""
+        await self._pending.flush()
+
+    async def close(self) -> None:
+        """Stop the flush timer and write out everything still buffered"""
+        await self._pending.close()
@@ -1,96 +1,448 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING, Awaitable, Dict, List, Union
+import logging
+from sys import getsizeof, intern
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
 import discord
 
+from ..leven._utils import maybe_awaitable
+from ..leven.cache import LRUCache
+from .write_behind import WriteBehind
+
 if TYPE_CHECKING:
     from discord import Client, Guild, Message
 
+    from ..leven.cache import CacheABC
     from .db_abc import DbClientABC
 
 __all__ = (
+    "CompiledPrefixes",
     "PrefixManager",
 )
 
+logger = logging.getLogger(__name__)
+
+class CompiledPrefixes:
+    """An immutable set of prefixes, merged with the mentions once per prefix set
+
+    Attributes
+    ----------
+    ordered : Tuple[str, ...]
+        The prefixes without duplicates, in the order they were given,
+        which is also the order discord.py tries them in
+    """
+    __slots__ = ("ordered",)
+
+    def __init__(self, prefixes: Iterable[str]) -> None:
+        self.ordered: Tuple[str, ...] = tuple(dict.fromkeys(prefixes))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ordered)
+
+    def __len__(self) -> int:
+        return len(self.ordered)
+
+    def __repr__(self) -> str:
+        return f"<CompiledPrefixes {self.ordered!r}>"
+
+    def sizeof(self) -> int:
+        """Estimate the bytes held by this object, without the prefix strings"""
+        return getsizeof(self) + getsizeof(self.ordered)
+
 class PrefixManager:
     """A manager for guild prefixes
 
+    Parameters
+    ----------
+    warm_cache : bool
+        Load the prefixes of every guild this client sees in the background,
+        guilds are picked up as they become available
+    warm_chunk : int
+        The number of guilds loaded per Db query while warming
+    warm_concurrency : int
+        The number of warming queries allowed to run at once
+    negative_ttl : float
+        Seconds to remember that a guild has no custom prefixes,
+        unused if the Db client reports changes from other processes
+    write_behind : Optional[float]
+        Buffer Db writes for up to this many seconds and write them in one
+        batch, only the latest prefixes of a guild are written.
+        Writes go straight to the Db if None
+    max_pending : int
+        Flush right away once this many guilds have buffered writes
+
     Note
     ----
+    Prefixes are stored as interned tuples, guilds with the same prefixes
+    share one tuple and one :class:`CompiledPrefixes`, see :meth:`memory_footprint`.
+
     This is an async class.
+    Call :meth:`close` before the Db client goes away when buffering writes.
     """
     async def __new__(cls, *args, **kw):
         self = super().__new__(cls)
         await self.__init__(*args, **kw)
         return self
 
-    async def __init__(self, prefix_default: Union[List[str], str], bot: Client, db_client: DbClientABC, *, warm_cache: bool = False) -> None: # type: ignore
+    # Seconds to wait for streamed guilds to fill up a warming chunk
+    WARM_LINGER = 0.05
+    # Unique prefix sets kept before unused ones are dropped
+    PRUNE_MIN = 1024
+    async def __init__(self, prefix_default: Union[List[str], str], bot: Client, db_client: DbClientABC, *, warm_cache: bool = False, warm_chunk: int = 1000, warm_concurrency: int = 4, negative_ttl: float = 300.0, cache: CacheABC[int, List[str]] = None, write_behind: Optional[float] = None, max_pending: int = 512) -> None: # type: ignore
         # This dict is for reads. We write to the Db for persistence
-        self._prefixes: Dict[int, List[str]] = {}
-        if warm_cache:
-            self._prefix = await db_client.load()
+        self._prefixes: Dict[int, Tuple[str, ...]] = {}
+        # Identical prefix sets are stored once, see _intern
+        self._interned: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self._shared: Dict[Tuple[str, ...], CompiledPrefixes] = {}
+        self._prune_at = self.PRUNE_MIN
         self.bot = bot
         self.db = db_client
+        # Optional shared cache consulted before the Db, see RemoteCache
+        self.cache = cache
+        self._tasks: Set[asyncio.Task] = set()
+        # guild ids known to have no custom prefixes
+        self._missing: LRUCache[int, bool] = LRUCache(ttl=negative_ttl)
+        # Concurrent misses for a guild share one lookup
+        self._lookups: Dict[int, asyncio.Task] = {}
+        # guild ids whose next load must skip the cache, see _on_remote_prefix
+        self._stale: Set[int] = set()
+        # get_prefix calls, and the Db queries they caused
+        self.messages = 0
+        self.db_lookups = 0
+        self.write_behind = write_behind
+        # guild id: the latest prefixes not yet written to the Db
+        self._pending: WriteBehind[int, List[str]] = WriteBehind(self.db.set_prefixes, write_behind, max_pending=max_pending, what="guild prefixes")
         user_id = self.bot.user.id
         self._mentions = [f'<@!{user_id}> ', f'<@{user_id}> ']
         self.pre_default: List[str] = prefix_default if isinstance(prefix_default, list) else [prefix_default]
-        self.default = self._mentions + self.pre_default
+        # guild id: the guild's prefixes merged with the mentions, see _compile
+        self._compiled: Dict[int, CompiledPrefixes] = {}
+        self._default = CompiledPrefixes([*self._mentions, *self.pre_default])
+        self.default = self._default.ordered
 
-    def __getitem__(self, guild: Guild) -> List[str]:
-        # Modifying via this is not persistent
-        # i.e prefix[guild].append("&") is not updated in DB
+        self.warm_chunk = warm_chunk
+        self.warm_concurrency = warm_concurrency
+        # every guild id queued for warming, loaded or not
+        self._warmed: Set[int] = set()
+        self._warm_queue: List[int] = []
+        self._warmer: Optional[asyncio.Task] = None
+        self.warm_loaded = 0
+        self.warm_time = 0.0
+        # Other processes tell us about their prefix changes,
+        # so nothing needs to expire if the Db client supports it
+        try:
+            self.listening = await self.db.listen_prefixes(self._on_remote_prefix)
+        except Exception:
+            logger.exception("Failed to listen for prefix changes from other processes")
+            self.listening = False
+        if self.listening:
+            self._missing.ttl = None
+
+        if warm_cache:
+            self.warm(self.bot.guilds)
+            self.bot.add_listener(self._warm_guild, "on_guild_available")
+            self.bot.add_listener(self._warm_guild, "on_guild_join")
+
+    def __getitem__(self, guild: Guild) -> Tuple[str, ...]:
+        # Shared with every guild using the same prefixes, so it is a tuple
         return self._prefixes[guild.id]
 
-    def __setitem__(self, guild: Guild, prefixes: List[str]) -> None:
+    def __setitem__(self, guild: Guild, prefixes: Sequence[str]) -> None:
         # await f[4] = ["5"] # is not possible!!!
         self.set_local_prefix(guild, prefixes)
 
-    async def __call__(self, _, msg: Message):
+    async def __call__(self, _, msg: Message) -> Tuple[str, ...]:
         return await self.get_prefix(msg.guild)
 
     def __repr__(self) -> str:
         return f"<PrefixManager of {repr(self.bot)}>"
 
     @property
-    def prefix(self) -> Dict[int, List[str]]:
+    def prefix(self) -> Dict[int, Tuple[str, ...]]:
         return self._prefixes
 
+    def memory_footprint(self) -> Dict[str, Any]:
+        """Report how much memory the stored prefixes take
+
+        ``bytes`` is an estimate from :func:`sys.getsizeof` of the dicts,
+        the unique prefix tuples and strings, and the compiled prefixes.
+        """
+        strings = {id(p): p for key in self._interned for p in key}
+        compiled = {id(i): i for i in self._compiled.values()}
+        size = getsizeof(self._prefixes) + getsizeof(self._compiled) + getsizeof(self._interned) + getsizeof(self._shared)
+        size += sum(getsizeof(i) for i in self._interned)
+        size += sum(getsizeof(i) for i in strings.values())
+        size += sum(i.sizeof() for i in compiled.values())
+        return {
+            "guilds": len(self._prefixes),
+            "compiled": len(self._compiled),
+            "unique_sets": len(self._interned),
+            "unique_compiled": len(compiled),
+            "unique_strings": len(strings),
+            "missing": len(self._missing),
+            "pending": len(self._pending),
+            "bytes": size
+        }
+
+    @property
+    def lookups_per_message(self) -> float:
+        return self.db_lookups / self.messages if self.messages else 0.0
+
     ## Getters ##
-    async def get_prefix(self, guild: Guild) -> List[str]:
+    async def get_prefix(self, guild: Guild) -> Tuple[str, ...]:
+        return (await self.get_compiled(guild)).ordered
+
+    async def get_compiled(self, guild: Guild) -> CompiledPrefixes:
+        self.messages += 1
         if not guild:
-            return self.default
-        prefixes = self._prefixes.get(guild.id, None)
-        if prefixes:
-            return prefixes + self._mentions
-        prefixes = await self.db.get_prefix(guild)
+            return self._default
+        compiled = self._compiled.get(guild.id, None)
+        if compiled is not None:
+            return compiled
+
+        if guild.id not in self._prefixes:
+            if self._missing.get(guild.id, False):
+                return self._default
+
+            lookup = self._lookups.get(guild.id, None)
+            if lookup is None:
+                lookup = self._lookups[guild.id] = asyncio.create_task(self._load_prefix(guild))
+                lookup.add_done_callback(lambda _: self._lookups.pop(guild.id, None))
+
+            # one cancelled message handler must not cancel the others
+            await asyncio.shield(lookup)
+
+        # re-read, the prefixes may have been set during the lookup
+        return self._compile(guild.id)
+
+    async def _load_prefix(self, guild: Guild) -> Optional[Tuple[str, ...]]:
+        prefixes = None
+        if guild.id in self._stale:
+            self._stale.discard(guild.id)
+        elif self.cache is not None:
+            prefixes = await maybe_awaitable(self.cache.get(guild.id))
+        if not prefixes:
+            self.db_lookups += 1
+            try:
+                prefixes = await self.db.get_prefix(guild)
+            except Exception:
+                # not negative cached, the next message tries again
+                logger.exception("Failed to load the prefixes of guild %d", guild.id)
+                return self._prefixes.get(guild.id, None)
+            if prefixes:
+                self._share(guild, prefixes)
         if prefixes:
-            self._prefix[guild.id] = prefixes
-            return prefixes + self._mentions
-        return self.default
+            # prefixes set during the lookup are newer
+            if guild.id not in self._prefixes:
+                self._store(guild.id, prefixes)
+            return self._prefixes[guild.id]
+
+        self._missing.put(guild.id, True)
+        return self._prefixes.get(guild.id, None)
 
-    def get_local_prefix(self, guild: Guild) -> List[str]:
+    def get_local_prefix(self, guild: Guild) -> Tuple[str, ...]:
         if not guild:
             return self.default # dm
-        prefixes = self._prefixes.get(guild.id, None)
+        compiled = self._compiled.get(guild.id, None) or self._compile(guild.id)
+        return compiled.ordered
+
+    def _compile(self, gid: int) -> CompiledPrefixes:
+        prefixes = self._prefixes.get(gid, None)
         if not prefixes:
-            return self.default
-        return prefixes + self._mentions
+            return self._default
+
+        # Built once per prefix set, messages after that
+        # get the same objects without allocating anything
+        compiled = self._shared.get(prefixes, None)
+        if compiled is None:
+            compiled = self._shared[prefixes] = CompiledPrefixes([*prefixes, *self._mentions])
+        self._compiled[gid] = compiled
+        return compiled
+
+    def _store(self, gid: int, prefixes: Iterable[str]) -> None:
+        self._prefixes[gid] = self._intern(prefixes)
+
+    def _intern(self, prefixes: Iterable[str]) -> Tuple[str, ...]:
+        key = tuple(map(intern, prefixes))
+        shared = self._interned.get(key, None)
+        if shared is not None:
+            return shared
 
-    def get_raw_prefix(self, guild: Guild) -> List[str]:
+        if len(self._interned) >= self._prune_at:
+            # drop the sets no guild uses anymore, amortised over PRUNE_MIN new sets at least
+            self._interned = {i: i for i in self._prefixes.values()}
+            self._shared = {k: v for k, v in self._shared.items() if k in self._interned}
+            self._prune_at = max(self.PRUNE_MIN, 2 * len(self._interned))
+        self._interned[key] = key
+        return key
+
+    def get_raw_prefix(self, guild: Guild) -> Sequence[str]:
         return self._prefixes.get(guild.id, self.pre_default)
 
+    def _share(self, guild: Guild, prefixes: Sequence[str]) -> None:
+        if self.cache is None:
+            return
+        task = asyncio.create_task(maybe_awaitable(self.cache.put(guild.id, list(prefixes))))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    ## Remote changes ##
+    def _on_remote_prefix(self, gid: Optional[int], prefixes: Optional[List[str]]) -> None:
+        if gid is None:
+            # Anything may be stale, guilds are loaded again on their next message.
+            # Buffered writes are newer than whatever the Db has.
+            self._forget(None)
+            # the shared cache can't be emptied, it is skipped for those guilds instead
+            if self.cache is not None:
+                self._stale.update(k for k in self._prefixes if k not in self._pending)
+            self._prefixes = {k: v for k, v in self._prefixes.items() if k in self._pending}
+            self._interned.clear()
+            self._shared.clear()
+            self._compiled.clear()
+            self._missing.clear()
+            return
+
+        # Ours is newer, it is announced once flushed
+        if gid in self._pending:
+            return
+
+        self._compiled.pop(gid, None)
+        self._missing.pop(gid)
+        if prefixes is None:
+            # the reload must reach the Db, not the cache
+            self._forget(gid, remote=True)
+            self._prefixes.pop(gid, None)
+        else:
+            self._forget(gid)
+            self._store(gid, prefixes)
+
+    def _forget(self, gid: Optional[int], remote: bool = False) -> None:
+        """Drop what the cache remembers locally of ``gid``, or of every guild if None
+
+        Entries are deleted from a shared cache too if ``remote`` is True.
+        """
+        cache = self.cache
+        if cache is None:
+            return
+
+        if gid is None:
+            forget_all = getattr(cache, "forget_all", None) or getattr(cache, "clear", None)
+            if forget_all is not None:
+                forget_all()
+        else:
+            # right away, the delete below only runs once the task starts
+            forget = getattr(cache, "forget", None) or getattr(cache, "pop", None)
+            if forget is not None:
+                forget(gid)
+            if remote and hasattr(cache, "delete"):
+                self._spawn(maybe_awaitable(cache.delete(gid)))
+
+    ## Warming ##
+    def warm(self, guilds: Iterable[Guild]) -> None:
+        """Load the prefixes of ``guilds`` in the background, in chunks"""
+        for guild in guilds:
+            if guild.id not in self._warmed:
+                self._warmed.add(guild.id)
+                self._warm_queue.append(guild.id)
+
+        if self._warm_queue and self._warmer is None:
+            self._warmer = asyncio.create_task(self._warm_loop())
+
+    async def _warm_guild(self, guild: Guild) -> None:
+        self.warm((guild,))
+
+    async def _warm_loop(self) -> None:
+        start = perf_counter()
+        loaded = queried = 0
+        limit = asyncio.Semaphore(self.warm_concurrency)
+        running: Set[asyncio.Task] = set()
+
+        try:
+            while self._warm_queue or running:
+                if not self._warm_queue:
+                    await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                if len(self._warm_queue) < self.warm_chunk:
+                    await asyncio.sleep(self.WARM_LINGER)
+
+                ids = self._warm_queue[:self.warm_chunk]
+                del self._warm_queue[:self.warm_chunk]
+
+                await limit.acquire()
+                task = asyncio.create_task(self._warm_chunk(ids))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: limit.release())
+                queried += len(ids)
+        finally:
+            self._warmer = None
+
+        elapsed = perf_counter() - start
+        self.warm_time += elapsed
+        logger.info("Warmed prefixes of %d guilds in %.2fs, %d in total with custom prefixes", queried, elapsed, self.warm_loaded)
+
+    async def _warm_chunk(self, ids: List[int]) -> None:
+        start = perf_counter()
+        try:
+            rows = await self.db.get_prefixes(ids)
+        except Exception:
+            logger.exception("Failed to warm the prefixes of %d guilds", len(ids))
+            # get_prefix loads them one by one instead
+            self._warmed.difference_update(ids)
+            return
+
+        for gid in ids:
+            prefixes = rows.get(gid, None)
+            if not prefixes:
+                self._missing.put(gid, True)
+            # prefixes set while the query ran are newer
+            elif gid not in self._prefixes:
+                self._store(gid, prefixes)
+                self.warm_loaded += 1
+
+        logger.debug("Warmed %d guild prefixes (%d custom) in %.1fms, %d still queued",
+            len(ids), len(rows), (perf_counter() - start) * 1e3, len(self._warm_queue))
+
+    ## Write behind ##
+    def _buffer(self, guild: Guild, prefixes: Sequence[str]) -> None:
+        self._pending.put(guild.id, list(prefixes))
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """Write all buffered prefixes to the Db in one batch"""
+        await self._pending.flush()
+
+    async def close(self) -> None:
+        """Stop warming, listening and the flush timer, then write out everything still buffered"""
+        await self.db.unlisten_prefixes()
+        if self._warmer is not None:
+            self._warmer.cancel()
+        await self._pending.close()
+
     ## Setters ##
-    def set_local_prefix(self, guild: Guild, prefixes: List[str]) -> None:
+    def set_local_prefix(self, guild: Guild, prefixes: Sequence[str]) -> None:
         if not guild:
             raise TypeError(f"Expected discord.Guild, instead got {type(guild)}")
-        self._prefixes[guild.id] = prefixes
+        self._store(guild.id, prefixes)
+        self._compiled.pop(guild.id, None)
+        self._missing.pop(guild.id)
         return None
 
     async def set_prefix(self, guild: Guild, prefixes: List[str]) -> None:
         self.set_local_prefix(guild, prefixes)
-        await self.db.set_prefix(guild, prefixes)
+        self._share(guild, prefixes)
+        if self.write_behind is not None:
+            self._buffer(guild, prefixes)
+        else:
+            await self.db.set_prefix(guild, prefixes)
         return None
 
     ## Modifiers ##
@@ -100,7 +452,8 @@ class PrefixManager:
         if guild.id not in self._prefixes:
             raise ValueError(f"No guild prefix record found with id: {guild.id}")
         else:
-            self._prefixes[guild.id].append(prefix)
+            self._store(guild.id, (*self._prefixes[guild.id], prefix))
+            self._compiled.pop(guild.id, None)
         return None
 
     async def append_prefix(self, guild: Guild, prefix: str) -> None:
@@ -108,7 +461,12 @@ class PrefixManager:
             await self.set_prefix(guild, self.pre_default + [prefix])
         else:
             self.append_local_prefix(guild, prefix)
-            await self.db.append_prefix(guild, prefix)
+            self._share(guild, self._prefixes[guild.id])
+            if self.write_behind is not None:
+                # latest wins, so the whole list is written instead
+                self._buffer(guild, self._prefixes[guild.id])
+            else:
+                await self.db.append_prefix(guild, prefix)
         return None
 
     ## task Methods ##
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Iterator, Optional, TypeVar
+
+__all__ = (
+    "WriteBehind",
+)
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+class WriteBehind(Generic[K, V]):
+    """A buffer of the latest value per key, written out in batches
+
+    A batch is written ``delay`` seconds after the first value buffered
+    since the last one, later values don't push it back. Once ``max_pending``
+    keys are buffered one batch is written right away. A failed batch goes
+    back in the buffer, unless newer values replaced it, and is retried
+    with an exponential backoff up to :attr:`MAX_RETRY_DELAY` seconds. Only
+    the retry timer writes while the retries last.
+
+    Parameters
+    ----------
+    write : Callable[[Dict[K, V]], Awaitable[None]]
+        Writes a batch, raising if it wasn't written
+    delay : Optional[float]
+        Seconds values are buffered for, retries back off from at least a second
+    max_pending : int
+        Write right away once this many keys are buffered
+    what : str
+        What the values are, for the logs
+    """
+    # Seconds between attempts to write a failed batch at most
+    MAX_RETRY_DELAY = 60.0
+
+    def __init__(self, write: Callable[[Dict[K, V]], Awaitable[None]], delay: Optional[float], *, max_pending: int = 512, what: str = "records") -> None:
+        self.write = write
+        self.delay = delay
+        self.max_pending = max_pending
+        self.what = what
+        # key: the latest value not yet written
+        self._pending: Dict[K, V] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        # a flush started by max_pending, and the flushes failed in a row
+        self._early: Optional[asyncio.Task] = None
+        self._retries = 0
+        # keeps batches in order, so an older one never lands last.
+        # Made on first use, the buffer may be made before the loop runs
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._pending
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self._pending)
+
+    def __repr__(self) -> str:
+        return f"<WriteBehind {self.what} pending={len(self._pending)} retries={self._retries}>"
+
+    def put(self, key: K, value: V) -> None:
+        self._pending[key] = value
+
+        # while writes fail only the retry timer writes, see _try_flush
+        if len(self._pending) >= self.max_pending and not self._retries:
+            if self._early is None or self._early.done():
+                self._early = asyncio.create_task(self._try_flush())
+        elif self._flusher is None:
+            # not pushed back by later values, so the delay stays bounded
+            self._flusher = asyncio.create_task(self._flush_later(self.delay or 0.0))
+
+    async def _flush_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._flusher = None
+        await self._try_flush()
+
+    async def _try_flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            self._retries += 1
+            delay = min(max(self.delay or 0.0, 1.0) * 2 ** (self._retries - 1), self.MAX_RETRY_DELAY)
+            logger.exception("Failed to write %d buffered %s, retrying in %.1fs", len(self._pending), self.what, delay)
+            # a timer set before the failure would retry without backing off
+            if self._flusher is not None:
+                self._flusher.cancel()
+            self._flusher = asyncio.create_task(self._flush_later(delay)) if self._pending else None
+        else:
+            self._retries = 0
+
+    async def flush(self) -> None:
+        """Write everything buffered in one batch"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            try:
+                await self.write(batch)
+            except BaseException:
+                # put the batch back unless newer values replaced it
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                raise
+
+    async def close(self) -> None:
+        """Stop the timer and write out everything still buffered"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sqlite3
+
+import pytest
+from discord import Object
+
+from neobot.core.utils import PgClient, SqliteClient
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def _with_client(client, test):
+    await client.init()
+    try:
+        await test(client)
+    finally:
+        await client.close()
+
+def _sqlite(tmp_path):
+    return SqliteClient(str(tmp_path / "neobot.db"), batch_delay=0.01)
+
+def _postgres(tmp_path):
+    dns = os.getenv("TEST_DATABASE_URL")
+    if not dns:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    return PgClient(dns, min_size=1, max_size=2)
+
+# Behaviour every client has to share
+@pytest.fixture(params=[_sqlite, _postgres], ids=["sqlite", "postgres"])
+def make_client(request, tmp_path):
+    return lambda: request.param(tmp_path)
+
+def test_prefixes(make_client):
+    async def test(client):
+        assert await client.get_prefix(Object(1)) is None
+
+        await client.set_prefix(Object(1), ["!", "?"])
+        assert await client.get_prefix(Object(1)) == ["!", "?"]
+
+        await client.append_prefix(Object(1), "$")
+        await client.append_prefix(Object(2), "%")
+        assert await client.get_prefix(Object(1)) == ["!", "?", "$"]
+        assert await client.get_prefix(Object(2)) == ["%"]
+
+        await client.set_prefixes({1: ["."], 3: [",", ";"]})
+        assert await client.get_prefixes([1, 3, 4]) == {1: ["."], 3: [",", ";"]}
+        assert (await client.load()).items() >= {1: ["."], 2: ["%"], 3: [",", ";"]}.items()
+
+    run(_with_client(make_client(), test))
+
+def test_settings(make_client):
+    async def test(client):
+        assert await client.get_settings(1) is None
+
+        await client.set_settings({1: {"disabled": ["help"]}, 2: {"cooldown": 3}})
+        assert await client.get_settings(1) == {"disabled": ["help"]}
+
+        # default settings drop the row
+        await client.set_settings({1: {}})
+        assert await client.get_settings(1) is None
+        assert await client.get_settings(2) == {"cooldown": 3}
+
+    run(_with_client(make_client(), test))
+
+def test_migrate_is_idempotent(make_client):
+    async def test(client):
+        assert await client.migrate() == client.__db_ver__
+        await client.create_prefix_table()
+        assert await client.migrate() == client.__db_ver__
+
+    run(_with_client(make_client(), test))
+
+# SqliteClient batching
+def test_sqlite_persists(tmp_path):
+    async def write(client):
+        await client.set_prefix(Object(5), ["!"])
+
+    async def read(client):
+        assert await client.get_prefix(Object(5)) == ["!"]
+
+    run(_with_client(_sqlite(tmp_path), write))
+    run(_with_client(_sqlite(tmp_path), read))
+
+def test_sqlite_newer_schema_is_refused(tmp_path):
+    con = sqlite3.connect(str(tmp_path / "neobot.db"))
+    con.execute(f"PRAGMA user_version = {SqliteClient.__db_ver__ + 1}")
+    con.close()
+
+    client = _sqlite(tmp_path)
+    with pytest.raises(RuntimeError):
+        run(client.init())
+    # nothing is left open, a later init starts over
+    assert client._executor is None and client._con is None
+
+    con = sqlite3.connect(str(tmp_path / "neobot.db"))
+    con.execute("PRAGMA user_version = 0")
+    con.close()
+    run(_with_client(client, lambda client: client.migrate()))
+
+def test_sqlite_writes_share_a_commit(tmp_path):
+    async def test(client):
+        await asyncio.gather(*(client.set_prefix(Object(gid), [str(gid)]) for gid in range(50)))
+        assert await client.get_prefixes(list(range(50))) == {gid: [str(gid)] for gid in range(50)}
+
+    run(_with_client(SqliteClient(str(tmp_path / "neobot.db"), batch_delay=0.05), test))
+
+def test_sqlite_failed_write_only_fails_itself(tmp_path):
+    async def test(client):
+        # batched together, the negative gid breaks the CHECK constraint
+        results = await asyncio.gather(
+            client.set_prefix(Object(7), ["!"]),
+            client.set_prefixes({8: ["?"], -1: ["$"]}),
+            client.append_prefix(Object(7), "$"),
+            return_exceptions=True
+        )
+        assert results[0] is None
+        assert isinstance(results[1], sqlite3.IntegrityError)
+        assert results[2] is None
+
+        assert await client.get_prefix(Object(7)) == ["!", "$"]
+        # the failing write is rolled back as a whole
+        assert await client.get_prefix(Object(8)) is None
+
+    run(_with_client(SqliteClient(str(tmp_path / "neobot.db"), batch_delay=0.05), test))
@@ -0,0 +1,97 @@
+import asyncio
+
+from neobot.core.leven import LRUCache, MemoryCacheServer, RemoteCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def _with_cache(test, **kwargs):
+    server = await MemoryCacheServer().start()
+    cache = RemoteCache(server.url, **kwargs)
+    try:
+        await test(server, cache)
+    finally:
+        await cache.close()
+        await server.close()
+
+def test_round_trip():
+    async def test(server, cache):
+        assert await cache.get("missing") is None
+        assert await cache.get("missing", 5) == 5
+
+        await cache.put("key", [1, "a"])
+        assert server.data[b"neobot:'key'"][0] == RemoteCache.dumps([1, "a"])
+
+        # a second client only sees the server
+        other = RemoteCache(server.url)
+        try:
+            assert await other.get("key") == [1, "a"]
+            assert await other.get_many(["key", "missing"]) == {"key": [1, "a"]}
+        finally:
+            await other.close()
+
+    run(_with_cache(test))
+
+def test_forget_and_delete():
+    async def test(server, cache):
+        await cache.put(1, "one")
+        server.data.clear()
+
+        # answered by the near cache until it forgets the key
+        assert await cache.get(1) == "one"
+        cache.forget(1)
+        assert await cache.get(1) is None
+
+        await cache.put(2, "two")
+        await cache.delete(2)
+        assert b"neobot:2" not in server.data
+        assert await cache.get(2) is None
+
+    run(_with_cache(test))
+
+def test_forget_all_keeps_remote_entries():
+    async def test(server, cache):
+        await cache.put_many({1: "one", 2: "two"})
+        cache.forget_all()
+        assert len(cache.near) == 0
+        assert await cache.get_many([1, 2]) == {1: "one", 2: "two"}
+
+    run(_with_cache(test, near=LRUCache(16)))
+
+def test_namespaces_dont_collide():
+    async def test(server, cache):
+        typo, prefix = cache.namespaced("typo"), cache.namespaced("prefix")
+        await typo.put(1, "typo")
+        await prefix.put(1, "prefix")
+        assert {b"neobot:typo:1", b"neobot:prefix:1"} <= set(server.data)
+
+        # both go through the same connection
+        assert prefix.conn is typo.conn is cache.conn
+        prefix.forget(1)
+        typo.forget(1)
+        assert await typo.get(1) == "typo"
+        assert await prefix.get(1) == "prefix"
+
+    run(_with_cache(test))
+
+def test_ttl():
+    async def test(server, cache):
+        await cache.put("key", "value")
+        cache.forget("key")
+        await asyncio.sleep(0.06)
+        assert await cache.get("key") is None
+
+    run(_with_cache(test, ttl=0.05))
+
+def test_server_close_with_connected_clients(capsys, caplog):
+    async def test():
+        server = await MemoryCacheServer().start()
+        cache = RemoteCache(server.url)
+        await cache.put("key", "value")
+        # the client is still connected
+        await server.close()
+        await cache.close()
+
+    run(test())
+    assert "CancelledError" not in capsys.readouterr().err + caplog.text
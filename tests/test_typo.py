@@ -0,0 +1,119 @@
+import asyncio
+import random
+from heapq import nsmallest
+
+from discord.ext import commands
+from polyleven import levenshtein
+
+from neobot.core.leven import LRUCache, NameIndex, TypoClient, similarity_func_factory
+
+
+def _names(count, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice("abcdefghij") for _ in range(rng.randint(2, 9))))
+    return sorted(names)
+
+def _brute(typo, names, num, cutoff):
+    top = nsmallest(num, ((levenshtein(typo, i, cutoff), i) for i in names))
+    return [i for i in top if i[0] <= cutoff]
+
+async def _noop(ctx):
+    pass
+
+class Group:
+    def __init__(self, names):
+        self.all_commands = dict.fromkeys(names)
+
+def test_index_search_matches_brute_force():
+    names = _names(400)
+    index = NameIndex(names)
+    for typo in _names(50, seed=1):
+        assert sorted(index.search(typo, 3)) == sorted((levenshtein(typo, i), i) for i in names if levenshtein(typo, i) <= 3)
+
+def test_index_add_remove():
+    index = NameIndex(["help", "hello"])
+    index.add("helot")
+    index.remove("hello")
+    index.remove("missing")
+    assert index.matches({"help", "helot"})
+    assert sorted(index.search("helo", 1)) == [(1, "helot"), (1, "help")]
+
+def test_top_matches_brute_force():
+    names = _names(400)
+    client = TypoClient(None, similarity_func_factory(4))
+    par = Group(names)
+    for typo in _names(100, seed=2):
+        assert client._gen_top(par, typo, 3) == _brute(typo, names, 3, 4)
+
+def test_index_follows_command_changes():
+    group = commands.Group(_noop, name="root")
+    group.add_command(commands.Command(_noop, name="hello"))
+    client = TypoClient(group, similarity_func_factory(2))
+    assert client._gen_top(group, "helo", 1) == [(1, "hello")]
+
+    # same count, different names
+    group.remove_command("hello")
+    group.add_command(commands.Command(_noop, name="helot"))
+    assert client._gen_top(group, "helo", 1) == [(1, "helot")]
+
+    # changes reported through sync_command are applied in place
+    command = commands.Command(_noop, name="help", aliases=["hlp"])
+    group.add_command(command)
+    client.sync_command(group, command)
+    assert client._gen_top(group, "hlep", 3) == [(1, "hlp"), (2, "help")]
+    assert client.get_index(group).matches({"helot", "help", "hlp"})
+
+def test_index_top_matches_search():
+    names = _names(400)
+    index = NameIndex(names)
+    for typo in _names(100, seed=3):
+        for num in (1, 3, 10):
+            assert index.top(typo, num, 4) == nsmallest(num, index.search(typo, 4))
+    assert index.top("abc", 0, 4) == []
+
+def test_generation_follows_renamed_subcommands():
+    group = commands.Group(_noop, name="root")
+    group.add_command(commands.Command(_noop, name="hello"))
+    client = TypoClient(None, similarity_func_factory(2, "osa"))
+    gen = client.generation(group)
+    assert client._gen_suggests(group, "helo") == [(1, "hello")]
+
+    group.remove_command("hello")
+    group.add_command(commands.Command(_noop, name="helot"))
+    assert client.generation(group) != gen
+    assert client._gen_suggests(group, "helo") == [(1, "helot")]
+
+def test_cache_keys_depend_on_the_distance():
+    async def test():
+        cache = LRUCache(16)
+        par = Group(["hello", "yellow"])
+        near = TypoClient(None, similarity_func_factory(1), cache)
+        far = TypoClient(None, similarity_func_factory(3), cache)
+        assert await near.generate_suggestions(par, "hell", 3) == [(1, "hello")]
+        assert await far.generate_suggestions(par, "hell", 3) == [(1, "hello"), (3, "yellow")]
+        assert near.variant != TypoClient(None, similarity_func_factory(1, "osa")).variant
+
+    asyncio.run(test())
+
+def test_weighted_modes_rerank_the_nearest():
+    names = _names(400)
+    par = Group(names)
+    for mode in ("osa", "qwerty"):
+        distance = similarity_func_factory(3, mode)
+        client = TypoClient(None, distance)
+        for typo in _names(100, seed=3):
+            top = client._gen_top(par, typo, 3)
+            assert top == sorted(top)
+            assert all(dist == distance(typo, name) <= 3 for dist, name in top)
+
+def test_weighted_modes_discount_typos():
+    osa = similarity_func_factory(2, "osa")
+    qwerty = similarity_func_factory(2, "qwerty")
+    assert osa("hlep", "help") == 1
+    assert qwerty("hwlp", "help") == 0.5
+    assert qwerty("hxlp", "help") == 1
+
+    client = TypoClient(None, qwerty)
+    assert client._gen_top(Group(["help", "hello", "hxlp"]), "hwlp", 2) == [(0.5, "help"), (1, "hxlp")]
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from neobot.core.logs import WebHookHandler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+class _Response:
+    status = 204
+    headers = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class _Session:
+    def __init__(self):
+        self.posted = []
+
+    def post(self, url, json):
+        self.posted.append(json)
+        return _Response()
+
+    async def close(self):
+        pass
+
+def _record(msg):
+    return logging.LogRecord("neobot.test", logging.WARNING, __file__, 1, msg, None, None)
+
+def test_flush_keeps_the_sender_running():
+    async def test():
+        session = _Session()
+        handler = WebHookHandler("https://example.invalid", session=session, dedup_window=None)
+        loop = asyncio.get_running_loop()
+        try:
+            handler.emit(_record("before"))
+            # logging.shutdown flushes from another thread
+            await loop.run_in_executor(None, handler.flush)
+            assert [i["embeds"][0]["title"] for i in session.posted] == ["neobot.test | WARNING"]
+            assert handler.sent == 1
+
+            handler.emit(_record("after"))
+            assert await handler.join(1)
+            assert handler.sent == 2
+            assert not handler._task.done()
+        finally:
+            await handler.aclose()
+
+    run(test())
+
+def test_aclose_sends_what_is_left():
+    async def test():
+        session = _Session()
+        handler = WebHookHandler("https://example.invalid", session=session, dedup_window=None)
+        handler._task.cancel()
+        handler.emit(_record("one"))
+        handler.emit(_record("two"))
+        await handler.aclose()
+        assert len(session.posted) == 1 and len(session.posted[0]["embeds"]) == 2
+        assert handler.sent == 2
+
+    run(test())
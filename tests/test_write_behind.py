@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from neobot.core.utils import WriteBehind
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+class _Db:
+    def __init__(self):
+        self.batches = []
+        self.attempts = 0
+        self.down = False
+
+    async def write(self, batch):
+        self.attempts += 1
+        await asyncio.sleep(0)
+        if self.down:
+            raise ConnectionError("down")
+        self.batches.append(batch)
+
+def test_latest_value_wins():
+    async def test():
+        db = _Db()
+        buf = WriteBehind(db.write, 0.01)
+        buf.put(1, "a")
+        buf.put(2, "b")
+        buf.put(1, "c")
+        assert 1 in buf and len(buf) == 2
+        await asyncio.sleep(0.05)
+        assert db.batches == [{1: "c", 2: "b"}]
+        assert not buf
+
+    run(test())
+
+def test_failing_writes_back_off():
+    async def test():
+        db = _Db()
+        db.down = True
+        buf = WriteBehind(db.write, 0.01, max_pending=10)
+        for gid in range(50):
+            buf.put(gid, str(gid))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.1)
+        # one early flush, then only the retry timer, a second away
+        assert db.attempts == 1
+        assert len(buf) == 50
+
+        db.down = False
+        buf.put(0, "new")
+        await buf.close()
+        assert db.batches == [{**{gid: str(gid) for gid in range(50)}, 0: "new"}]
+
+    run(test())
+
+def test_failed_batch_is_kept():
+    async def test():
+        db = _Db()
+        db.down = True
+        buf = WriteBehind(db.write, None)
+        buf.put(1, "a")
+        with pytest.raises(ConnectionError):
+            await buf.flush()
+        assert 1 in buf
+
+    run(test())